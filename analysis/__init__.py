@@ -24,4 +24,5 @@ Nomenclature used in this package:
 Requires Python 3.10 or later.
 """
 
-from analysis import amplitude, fetch, fit, geom, oscil, paths, plot, read, split, write
+from analysis import (amplitude, bench, cli, columnar, fetch, fit, framecache, freshness, geom,
+                      oscil, paths, plot, read, split, write)
@@ -14,6 +14,7 @@ import analysis as anl
 class Commands(Enum):
     """CLI commands."""
 
+    BENCHMARK = auto()
     PREPARSE = auto()
     RESONANCE = auto()
     SPATIAL = auto()
@@ -66,6 +67,23 @@ def __resolve_dates(values: list[str]) -> list[str]:
         return values
 
 
+def __report_render(count: int, t_start: float):
+    """Prints the number of plots rendered since `t_start`, and their rate."""
+    print(f"  Rendered {count} figures at {count / max(time() - t_start, 1e-9):.1f} figures/s.")
+
+
+def __is_fresh(save_to: str, inputs: list[str], params: dict = None) -> bool:
+    """Checks if a plot is up to date with its inputs (see `analysis.freshness`),
+    and prints a note if so.
+    """
+
+    if anl.freshness.is_fresh(save_to, inputs, params):
+        print(f"  Up to date: {os.path.basename(save_to)}")
+        return True
+
+    return False
+
+
 def __timed_run(anl_funcs: list):
     """Runs all analyses."""
 
@@ -79,7 +97,8 @@ def __timed_run(anl_funcs: list):
             print(f"  Done in {time() - t_start:.1f}s.")
 
         print(f"Finished {len(anl_funcs)} {'analysis' if len(anl_funcs) == 1 else 'analyses'} in",
-              f"{time() - t_init:.1f}s.\n")
+              f"{time() - t_init:.1f}s.")
+        print(anl.framecache.FRAMES.report(), end="\n\n")
 
     else:
         print(
@@ -124,6 +143,11 @@ def __parse_cli_input() -> tuple:
         description="Readies mumax3 output before being uploaded."
     )
 
+    comm_benchmark = subparser.add_parser(
+        "benchmark",
+        description="Compares the parsers available for reading table data."
+    )
+
     # Top-level args
 
     parser.add_argument(
@@ -133,6 +157,8 @@ def __parse_cli_input() -> tuple:
         help="activates CLI test mode; analysis functions will not be run."
     )
 
+    options = anl.cli.add_top_options(parser)
+
     # resonance args
 
     argobj_resonance_dates = comm_resonance.add_argument(
@@ -162,6 +188,8 @@ def __parse_cli_input() -> tuple:
         help="the number of split levels to plot, defaults to 1"
     )
 
+    options.update(anl.cli.add_resonance_options(comm_resonance))
+
     # spatial args
 
     argobj_spatial_dates = comm_spatial.add_argument(
@@ -267,23 +295,71 @@ def __parse_cli_input() -> tuple:
         help="the type of simulaton to preparse, e.g. resonance, spatial"
     )
 
+    comm_preparse.add_argument(
+        "--max-memory",
+        dest="max_memory",
+        type=anl.cli.parse_size,
+        required=False,
+        default=None,
+        help="the approximate memory to use when converting the table (e.g. 512M, 2G), defaults"
+            + " to reading the whole table"
+    )
+
+    # benchmark args
+
+    argobj_benchmark_dates = comm_benchmark.add_argument(
+        "date",
+        type=str,
+        nargs='*',
+        default=[anl.paths.top.latest_date()],
+        help="the list of dates to benchmark (YYYY-MM-DD_hhmm), defaults to latest"
+    )
+
+    argobj_engines = comm_benchmark.add_argument(
+        "--engines",
+        type=str,
+        nargs='+',
+        required=False,
+        default=None,
+        help="the parsers to compare, any of: c pyarrow, defaults to all that are installed"
+    )
+
+    comm_benchmark.add_argument(
+        "--repeat",
+        type=int,
+        required=False,
+        default=3,
+        help="the number of reads with each parser, of which the fastest is reported, defaults"
+            + " to 3"
+    )
+
     # Parsing
 
     args = parser.parse_args()
+    top_args = (args.cli_test, args.cache_size, args.csv_engine, args.force)
+
+    if args.csv_engine is not None:
+        __validate_arg_option(args.csv_engine, *options["csv_engine"])
 
     if args.command == "resonance":
 
         __validate_date(args.date, argobj_resonance_dates)
         __validate_arg_list(args.mag_vars, argobj_mag_vars, ("mx", "my", "mz"))
+        for dest in ("pool", "amp_estimator", "plot_output"):
+            __validate_arg_option(getattr(args, dest), *options[dest])
 
-        return (Commands.RESONANCE, (args.date, args.mag_vars, args.plot_depth), (args.cli_test,))
+        return (
+            Commands.RESONANCE,
+            (args.date, args.mag_vars, args.plot_depth, anl.cli.ResonanceOptions.from_args(args)),
+            top_args
+        )
 
     if args.command == "spatial":
 
         __validate_date(args.date, argobj_spatial_dates)
         __validate_arg_list(args.components, argobj_spatial_components, ("x", "y", "z"))
 
-        return (Commands.SPATIAL, (args.date, args.components, args.quantities), (args.cli_test,))
+        return (Commands.SPATIAL, (args.date, args.components, args.quantities), top_args)
 
     if args.command == "spatialline":
 
@@ -297,14 +373,36 @@ def __parse_cli_input() -> tuple:
         elif args.y_val is not None:
             comm_args.extend(("y", args.y_val))
 
-        return (Commands.SPATIALLINE, list(comm_args), (args.cli_test,))
+        return (Commands.SPATIALLINE, list(comm_args), top_args)
 
     if args.command == "preparse":
 
         __validate_date(args.date, argobj_preparse_dates)
         __validate_arg_option(args.result_type, argobj_result_type, ("resonance", "spatial"))
 
-        return (Commands.PREPARSE, (args.date, args.result_type), (args.cli_test,))
+        return (Commands.PREPARSE, (args.date, args.result_type, args.max_memory), top_args)
+
+    if args.command == "benchmark":
+
+        __validate_date(args.date, argobj_benchmark_dates)
+        if args.engines is not None:
+            __validate_arg_list(args.engines, argobj_engines, ("c", "pyarrow"))
+
+        return (Commands.BENCHMARK, (args.date, args.engines, args.repeat), top_args)
+
+#endregion
+
+#region Reads
+
+def __read_table(columns: list[str]):
+    """Reads the requested columns of the table as float32 for plotting, or
+    maps them into memory if --memory-map is set.
+    """
+
+    if OPTIONS.memory_map:
+        return anl.read.map_data(anl.paths.data.data_path(DATE), columns)
+    else:
+        return anl.read.read_data(anl.paths.data.data_path(DATE), columns, float32=True)
 
 #endregion
 
@@ -322,24 +420,35 @@ def __fetch_raw():
 
 def __split_phi():
     print("Splitting by phi...")
-    anl.split.split_phi(DATE)
+    anl.split.split_phi(DATE, mapped=OPTIONS.memory_map, max_memory=MAX_MEMORY,
+        store=OPTIONS.split_store, workers=OPTIONS.split_workers, incremental=OPTIONS.incremental)
 
 
 def __split_phi_fRF():
     print("Splitting by phi, f_RF...")
-    anl.split.split_phi_fRF(DATE)
+    anl.split.split_phi_fRF(DATE, mapped=OPTIONS.memory_map, max_memory=MAX_MEMORY,
+        store=OPTIONS.split_store, workers=OPTIONS.split_workers, incremental=OPTIONS.incremental)
 
 
 def __calc_amp():
     print("Calculating amplitude data...")
-    anl.amplitude.amp_phi_fRF(DATE)
-    anl.amplitude.max_amp_phi(DATE)
+    anl.amplitude.amp_phi_fRF(DATE, mapped=OPTIONS.memory_map,
+        skip_duration=OPTIONS.skip_duration, estimator=OPTIONS.amp_estimator)
+    anl.amplitude.max_amp_phi(DATE, mapped=OPTIONS.memory_map)
 
 
 def __calc_mag_fit():
     print("Calculating curve-fit for amplitudes...")
-    for mag in MAG_VARS:
-        anl.fit.fit_cauchy(mag_var=mag, xlim=[3.5e9, 6.0e9], date=DATE)
+
+    failed = anl.fit.fit_cauchy_batch([DATE], MAG_VARS, xlim=[3.5e9, 6.0e9],
+        workers=OPTIONS.fit_workers, resamples=OPTIONS.bootstrap)
+
+    for _, mag, phi, error in failed:
+        print(f"  Curve-fit failed for amp_{mag} at {phi}: {error}")
+
+    if OPTIONS.max_peaks > 1:
+        for mag in MAG_VARS:
+            anl.fit.fit_peaks(mag, xlim=[3.5e9, 6.0e9], max_peaks=OPTIONS.max_peaks, date=DATE)
 
 #endregion
 
@@ -347,58 +456,99 @@ def __calc_mag_fit():
 
 def __plot_mag():
     print("Plotting mx, my, mz against t from table data...")
+
+    save_to = os.path.join(
+        anl.paths.plots.plot_dir(DATE, ["aggregate"]), "mx, my, mz against t.pdf")
+    inputs, params = [anl.paths.data.data_path(DATE)], {"max_points": OPTIONS.max_points}
+
+    if __is_fresh(save_to, inputs, params):
+        return
+
     anl.plot.plot_xy(
         attr_data=anl.read.AttributedData(
-            data=anl.read.read_data(anl.paths.data.data_path(DATE)),
+            data=__read_table(["t", "mx", "my", "mz"]),
             x_var="t",
             y_vars=["mx", "my", "mz"]
         ),
         xlabel="t (s)",
-        save_to=os.path.join(
-            anl.paths.plots.plot_dir(DATE, ["aggregate"]), "mx, my, mz against t.pdf")
+        save_to=save_to,
+        max_points=OPTIONS.max_points
     )
+    anl.freshness.record(save_to, inputs, params)
 
 
 def __plot_MaxAngle():                                                #pylint: disable=invalid-name
     print("Plotting MaxAngle against t from table data...")
+
+    save_to = os.path.join(anl.paths.plots.plot_dir(DATE, ["aggregate"]), "MaxAngle against t.pdf")
+    inputs, params = [anl.paths.data.data_path(DATE)], {"max_points": OPTIONS.max_points}
+
+    if __is_fresh(save_to, inputs, params):
+        return
+
     anl.plot.plot_xy(
         attr_data=anl.read.AttributedData(
-            data=anl.read.read_data(anl.paths.data.data_path(DATE)),
+            data=__read_table(["t", "MaxAngle"]),
             x_var="t",
             y_vars=["MaxAngle"]
         ),
         xlabel="t (s)",
         ylabel="MaxAngle (rad)",
-        save_to=os.path.join(
-            anl.paths.plots.plot_dir(DATE, ["aggregate"]), "MaxAngle against t.pdf")
+        save_to=save_to,
+        max_points=OPTIONS.max_points
     )
+    anl.freshness.record(save_to, inputs, params)
 
 
 def __plot_mag_phi():
     print("Plotting mx, my, mz against t from data split by phi...")
-    anl.plot.plot_dataset_xy(
-        attr_data=anl.read.read_dataset(anl.paths.data.dataset_dir(DATE, {"phi": None})),
+    t_start = time()
+    count = anl.plot.plot_dataset_xy(
+        attr_data=anl.read.read_dataset(
+            anl.paths.data.dataset_dir(DATE, {"phi": None}),
+            columns=["t", "mx", "my", "mz"],
+            float32=True,
+            lazy=True
+        ),
         x_var="t",
         y_vars=["mx", "my", "mz"],
         xlabel="t (s)",
         ylim=(-1.0, 1.0),
-        save_to_root=anl.paths.plots.plot_dir(DATE, ["phi"])
+        save_to_root=anl.paths.plots.plot_dir(DATE, ["phi"]),
+        read_workers=OPTIONS.workers,
+        read_pool=OPTIONS.pool,
+        render_workers=OPTIONS.render_workers,
+        max_points=OPTIONS.max_points,
+        output=OPTIONS.plot_output,
+        sheet_panels=OPTIONS.sheet_panels
     )
+    __report_render(count, t_start)
 
 
 def __plot_mag_phi_fRF():
     print("Plotting mx, my, mz against t from data split by phi, f_RF...")
 
     if PLOT_DEPTH >= 2:
-        anl.plot.plot_dataset_xy(
+        t_start = time()
+        count = anl.plot.plot_dataset_xy(
             attr_data=anl.read.read_dataset(
-                anl.paths.data.dataset_dir(DATE, {"phi": None, "f_RF": None})
+                anl.paths.data.dataset_dir(DATE, {"phi": None, "f_RF": None}),
+                columns=["t", "mx", "my", "mz"],
+                float32=True,
+                lazy=True
             ),
             x_var="t",
             y_vars=["mx", "my", "mz"],
             xlabel="t (s)",
-            save_to_root=anl.paths.plots.plot_dir(DATE, ["phi, f_RF"])
+            save_to_root=anl.paths.plots.plot_dir(DATE, ["phi, f_RF"]),
+            read_workers=OPTIONS.workers,
+            read_pool=OPTIONS.pool,
+            render_workers=OPTIONS.render_workers,
+            max_points=OPTIONS.max_points,
+            output=OPTIONS.plot_output,
+            sheet_panels=OPTIONS.sheet_panels
         )
+        __report_render(count, t_start)
 
     else:
         print("Skipped.")
@@ -407,6 +557,14 @@ def __plot_mag_phi_fRF():
 def __plot_amp():
     print("Plotting amp against f_RF...")
     for mag in MAG_VARS:
+
+        save_to = os.path.join(
+            anl.paths.plots.plot_dir(DATE, ["aggregate"]), f"amp_{mag} against f_RF.pdf")
+        inputs = [anl.paths.calcvals.amp_path(mag, DATE)]
+
+        if __is_fresh(save_to, inputs):
+            continue
+
         amp_data = anl.read.read_data(anl.paths.calcvals.amp_path(mag, DATE))
         anl.plot.plot_xy(
             attr_data=anl.read.AttributedData(
@@ -416,13 +574,20 @@ def __plot_amp():
             ),
             xlabel="f_RF (Hz)",
             ylabel=f"amp_{mag}",
-            save_to=os.path.join(
-                anl.paths.plots.plot_dir(DATE, ["aggregate"]), f"amp_{mag} against f_RF.pdf")
+            save_to=save_to
         )
+        anl.freshness.record(save_to, inputs)
 
 
 def __plot_MaxAmp():                                                  #pylint: disable=invalid-name
     print("Plotting MaxAmp against phi...")
+
+    save_to = os.path.join(anl.paths.plots.plot_dir(DATE, ["aggregate"]), "MaxAmp against phi.pdf")
+    inputs = [anl.paths.calcvals.maxamp_path(DATE)]
+
+    if __is_fresh(save_to, inputs):
+        return
+
     anl.plot.plot_xy(
         attr_data=anl.read.AttributedData(
             data=anl.read.read_data(anl.paths.calcvals.maxamp_path(DATE)),
@@ -432,14 +597,22 @@ def __plot_MaxAmp():                                                  #pylint: d
         xlabel="phi (deg)",
         ylabel="MaxAmp",
         xstep=45,
-        save_to=os.path.join(
-            anl.paths.plots.plot_dir(DATE, ["aggregate"]), "MaxAmp against phi.pdf")
+        save_to=save_to
     )
+    anl.freshness.record(save_to, inputs)
 
 
 def __plot_fitted_amp():
     print("Plotting curve-fitted amp against f_RF...")
     for mag in MAG_VARS:
+
+        save_to = os.path.join(
+            anl.paths.plots.plot_dir(DATE, ["aggregate"]), f"fitted amp_{mag} against f_RF.pdf")
+        inputs = [anl.paths.calcvals.fitted_amp_path(mag, DATE)]
+
+        if __is_fresh(save_to, inputs):
+            continue
+
         anl.plot.plot_function(
             data=anl.read.read_data(anl.paths.calcvals.fitted_amp_path(mag, DATE)),
             func=anl.fit.cauchy,
@@ -447,11 +620,40 @@ def __plot_fitted_amp():
             domain=[3.5e9, 6.0e9],
             xlabel="f_RF (Hz)",
             ylabel=f"fitted amp_{mag}",
-            save_to=os.path.join(
-                anl.paths.plots.plot_dir(DATE, ["aggregate"]),
-                f"fitted amp_{mag} against f_RF.pdf"
-            )
+            save_to=save_to
+        )
+        anl.freshness.record(save_to, inputs)
+
+
+def __plot_fitted_peaks():
+    print("Plotting curve-fitted peaks of amp against f_RF...")
+    params = [f"{param}_{i}"
+        for i in range(1, OPTIONS.max_peaks + 1) for param in ("x_0", "gamma", "I")]
+    for mag in MAG_VARS:
+
+        save_to = os.path.join(anl.paths.plots.plot_dir(DATE, ["aggregate"]),
+            f"fitted peaks amp_{mag} against f_RF.pdf")
+        inputs = [anl.paths.calcvals.fitted_peaks_path(mag, DATE)]
+
+        # Plots made by an earlier run with multi-peak fitting are out of date.
+        if OPTIONS.max_peaks <= 1:
+            anl.freshness.remove(save_to)
+            print(f"  Skipped: {os.path.basename(save_to)}")
+            continue
+
+        if __is_fresh(save_to, inputs, {"params": params}):
+            continue
+
+        anl.plot.plot_function(
+            data=anl.read.read_data(anl.paths.calcvals.fitted_peaks_path(mag, DATE)),
+            func=anl.fit.lorentzian_sum,
+            params=params,
+            domain=[3.5e9, 6.0e9],
+            xlabel="f_RF (Hz)",
+            ylabel=f"fitted amp_{mag}",
+            save_to=save_to
         )
+        anl.freshness.record(save_to, inputs, {"params": params})
 
 
 #endregion
@@ -462,6 +664,14 @@ def __plotcheck_fitted_amp():
     print("Checks: Plotting curve fit with data points for amp against f_RF...")
     for var in MAG_VARS:
 
+        save_to = os.path.join(
+            anl.paths.plots.plot_dir(DATE, ["checks"]), f"check amp_{var} against f_RF.pdf")
+        inputs = [anl.paths.calcvals.fitted_amp_path(var, DATE),
+            anl.paths.calcvals.amp_path(var, DATE)]
+
+        if __is_fresh(save_to, inputs):
+            continue
+
         curve_data = anl.read.read_data(anl.paths.calcvals.fitted_amp_path(var, DATE))
         amp_data = anl.read.read_data(anl.paths.calcvals.amp_path(var, DATE))
         rows = curve_data["phi"][::(len(curve_data["phi"]) // 4)]     # Extracts a few sample rows.
@@ -481,11 +691,9 @@ def __plotcheck_fitted_amp():
             xlabel="f_RF (Hz)",
             ylabel=f"fitted amp_{var}",
             title=f"Curve-fit check for amp_{var}",
-            save_to=os.path.join(
-                anl.paths.plots.plot_dir(DATE, ["checks"]),
-                f"check amp_{var} against f_RF.pdf"
-            )
+            save_to=save_to
         )
+        anl.freshness.record(save_to, inputs)
 
 
 #endregion
@@ -522,6 +730,13 @@ def __plot_spatial():
     for filename in plot_files:
         for component in COMPONENTS:
 
+            save_to = anl.paths.plots.spatial_dir(filename, component, DATE)
+            inputs = [anl.paths.spatial.spatial_path(filename, component, None, DATE),
+                anl.paths.spatial.header_path(DATE)]
+
+            if __is_fresh(save_to, inputs):
+                continue
+
             try:
                 anl.plot.plot_image(
                     anl.read.read_data(
@@ -531,14 +746,13 @@ def __plot_spatial():
                     xlabel="x (m)",
                     ylabel="y (m)",
                     title=filename + " (T)",
-                    save_to=anl.paths.plots.spatial_dir(
-                        filename, component, DATE
-                    ),
+                    save_to=save_to,
                     xindexes=None,
                     yindexes=None,
                     show_plot=False,
                     date=DATE
                 )
+                anl.freshness.record(save_to, inputs)
 
             except FileNotFoundError:
 
@@ -582,7 +796,7 @@ def __plot_spatial_line():
 
 def __convert_table_txt():
     print("Converting table.txt to table.tsv...")
-    anl.read.convert_table_txt(DATE)
+    anl.read.convert_table_txt(DATE, max_memory=MAX_MEMORY)
 
 def __create_json():
     print("Creating the json file...")
@@ -590,21 +804,39 @@ def __create_json():
 
 #endregion
 
+#region Benchmark
+
+def __bench_read():
+    print("Benchmarking table.tsv reads...")
+
+    if os.path.isfile(anl.paths.data.data_path(DATE)):
+        print(anl.bench.report_read(anl.paths.data.data_path(DATE), ENGINES, REPEAT))
+    else:
+        print("Table data not found.")
+
+#endregion
+
 #region Run
 
 COMMAND, COMM_ARGS, TOP_ARGS = __parse_cli_input()
 
 if COMMAND is Commands.RESONANCE:
-    date_arg, MAG_VARS, PLOT_DEPTH = COMM_ARGS                               #pylint: disable=W0632
+    date_arg, MAG_VARS, PLOT_DEPTH, OPTIONS = COMM_ARGS                      #pylint: disable=W0632
+    MAX_MEMORY = OPTIONS.max_memory
 elif COMMAND is Commands.SPATIAL:
     date_arg, COMPONENTS, QUANTITIES = COMM_ARGS                             #pylint: disable=W0632
 elif COMMAND is Commands.SPATIALLINE:
     date_arg, QUANTITY, COMPONENTS, SHOW, SAVE, AXIS, AXIS_VAL = COMM_ARGS   #pylint: disable=W0632
 elif COMMAND is Commands.PREPARSE:
-    date_arg, RESULT_TYPE = COMM_ARGS                                        #pylint: disable=W0632
+    date_arg, RESULT_TYPE, MAX_MEMORY = COMM_ARGS                            #pylint: disable=W0632
+elif COMMAND is Commands.BENCHMARK:
+    date_arg, ENGINES, REPEAT = COMM_ARGS                                    #pylint: disable=W0632
 
 DATES = __resolve_dates(date_arg)
-CLI_TEST = TOP_ARGS[0]
+CLI_TEST, anl.framecache.FRAMES.max_bytes, CSV_ENGINE, anl.freshness.FORCE = TOP_ARGS
+
+if CSV_ENGINE is not None:
+    os.environ[anl.read.CSV_ENGINE_ENV] = CSV_ENGINE        # Also applies to worker processes.
 
 if len(DATES) > 1:
     print(f"Running analysis for {len(DATES)} results: {DATES}. \n")
@@ -622,6 +854,7 @@ if COMMAND is Commands.RESONANCE:
             f"date: {repr(DATE)}",
             f"mag-vars: {repr(MAG_VARS)}",
             f"plot-depth: {repr(PLOT_DEPTH)}",
+            *OPTIONS.describe(),
             sep='\n  ',
             end='\n\n'
         )
@@ -640,6 +873,7 @@ if COMMAND is Commands.RESONANCE:
             __plot_amp,
             __plot_MaxAmp,
             __plot_fitted_amp,
+            __plot_fitted_peaks,
             __plotcheck_fitted_amp
         ])
 
@@ -698,6 +932,7 @@ elif COMMAND is Commands.PREPARSE:
             "Running analysis (preparse) with parameters:",
             f"date: {repr(DATE)}",
             f"result_type: {repr(RESULT_TYPE)}",
+            f"max-memory: {repr(MAX_MEMORY)}",
             sep='\n  ',
             end='\n\n'
         )
@@ -707,4 +942,21 @@ elif COMMAND is Commands.PREPARSE:
         elif RESULT_TYPE == "spatial":
             __timed_run([__create_json])
 
+elif COMMAND is Commands.BENCHMARK:
+
+    for date in DATES:
+
+        DATE = date
+
+        print(
+            "Running benchmark with parameters:",
+            f"date: {repr(DATE)}",
+            f"engines: {repr(ENGINES)}",
+            f"repeat: {repr(REPEAT)}",
+            sep='\n  ',
+            end='\n\n'
+        )
+
+        __timed_run([__bench_read])
+
 #endregion
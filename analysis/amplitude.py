@@ -1,79 +1,437 @@
 """Find amplitude from dataset"""
 
+import warnings
+
 import numpy as np
 import pandas as pd
+from scipy import signal
 
 from analysis import paths, read, write
 
+# The default duration, in seconds, of the transient at the start of each f_RF segment which is
+# excluded from its amplitude.
+SKIP_DURATION = 1.5e-9
+
+# The length, in periods of f_RF, of the windows in which the envelope is measured to detect the
+# steady state, the number of windows over which it is smoothed, the relative deviation from the
+# steady envelope which counts as transient, and the least number of periods of f_RF which must
+# remain after the transient, or else `SKIP_DURATION` is used. See `amp_phi_fRF`.
+STEADY_PERIODS = 1
+STEADY_SMOOTHING = 5
+STEADY_TOLERANCE = 0.05
+STEADY_MIN_PERIODS = 4
+
+# The greatest number of rows of the table, including padding, gathered into 2-D arrays of
+# segments at a time, which bounds the memory used by `amp_phi_fRF`.
+BATCH_ROWS = 2**18
+
+MAG_VARS = ("mx", "my", "mz")
+
+# The methods of estimating the amplitude of a segment. See `amp_phi_fRF`.
+ESTIMATORS = ("peak", "rms", "lockin", "hilbert")
+
+
+def __read_sweep(
+    date: str,
+    mapped: bool,
+    columns: list[str] = None
+) -> pd.DataFrame | dict[str, np.ndarray]:
+    """Reads columns of the table, defaulting to phi and f_RF, or maps them
+    into memory if `mapped`.
+    """
+
+    columns = columns if columns is not None else ["phi", "f_RF"]
+
+    if mapped:
+        return read.map_data(paths.data.data_path(date), columns)
+    else:
+        return read.read_data(paths.data.data_path(date), columns)
+
 
-def __calc_amp(date: str, phi: str, fRF: float, mag_var: str) -> float:
+def __segments(phi: np.ndarray, fRF: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Finds the segments of the table which `split.split_phi_fRF` splits into
+    separate data files: runs of consecutive rows with the same phi and f_RF.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The index of the first row of
+          each segment, and the index of the first row of the run of phi
+          which contains it.
     """
-    Finds the amplitudes for one variable.
+
+    phi_starts, starts = [[0]], [[0]]
+
+    # Compares consecutive rows in blocks, so that only a block is held in memory.
+    for i in range(1, len(phi), BATCH_ROWS):
+
+        stop = min(i + BATCH_ROWS, len(phi))
+        rows, previous = slice(i, stop), slice(i - 1, stop - 1)
+        phi_changes = phi[rows] != phi[previous]
+
+        phi_starts.append(i + np.flatnonzero(phi_changes))
+        starts.append(i + np.flatnonzero(phi_changes | (fRF[rows] != fRF[previous])))
+
+    phi_starts, starts = np.concatenate(phi_starts), np.concatenate(starts)
+
+    return starts, phi_starts[np.searchsorted(phi_starts, starts, side='right') - 1]
+
+
+def __segment_t(t: np.ndarray, starts: np.ndarray, phi_start_t: np.ndarray) -> np.ndarray:
+    """Returns t relative to the start of each segment, given the value of t
+    at the start of the run of phi which contains each segment.
+
+    t is reset in two steps, first relative to the start of the run of phi
+    and then to the start of the segment, as in `split.split_phi_fRF`, so that
+    the result is identical to t in the split data files.
+    """
+
+    lengths = np.diff(np.append(starts, len(t)))
+
+    t_phi = t - np.repeat(phi_start_t, lengths)
+
+    return t_phi - np.repeat(t_phi[starts], lengths)
+
+
+def __pad_index(
+    mask: np.ndarray,
+    starts: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, tuple[int, int]]:
+    """Indexes the rows in `mask` for gathering them into a 2-D array with a
+    row per segment, left-aligned and padded to the longest segment.
+
+    Returns:
+        tuple: The rows in `mask`, the segment and the position in it of each
+          row, and the shape of the padded array.
+    """
+
+    rows = np.flatnonzero(mask)
+    segment = np.searchsorted(starts, rows, side='right') - 1
+    counts = np.bincount(segment, minlength=len(starts))
+    position = np.arange(len(rows)) - (np.cumsum(counts) - counts)[segment]
+
+    return rows, segment, position, (len(starts), counts.max() if len(counts) else 0)
+
+
+def __pad(values: np.ndarray, index: tuple) -> np.ndarray:
+    """Gathers values into a padded 2-D array of segments (see `__pad_index`),
+    padded with NaN.
+    """
+
+    rows, segment, position, shape = index
+
+    padded = np.full(shape, np.nan)
+    padded[segment, position] = values[rows]
+
+    return padded
+
+
+def __batches(lengths: np.ndarray, max_rows: int) -> list[tuple[int, int]]:
+    """Groups consecutive segments into batches whose padded 2-D array (see
+    `__pad`) has at most `max_rows` values, or which have a single segment.
+
+    Returns:
+        list[tuple[int, int]]: The first segment of each batch and the segment
+          after its last.
+    """
+
+    batches = []
+    first, longest = 0, 0
+
+    for i, length in enumerate(lengths):
+
+        if i > first and (i + 1 - first) * max(longest, length) > max_rows:
+            batches.append((first, i))
+            first, longest = i, 0
+
+        longest = max(longest, length)
+
+    if len(lengths) > 0:
+        batches.append((first, len(lengths)))
+
+    return batches
+
+
+def __estimate_amp(
+    values: np.ndarray,
+    t: np.ndarray,
+    fRF: np.ndarray,
+    estimator: str
+) -> np.ndarray:
+    """Estimates the amplitude of each segment in a padded 2-D array of
+    segments (see `__pad`). NaN values are ignored, and segments without any
+    values give NaN.
+
+    Args:
+        t (numpy.ndarray): The padded 2-D array of t of each segment.
+        fRF (numpy.ndarray): The f_RF of each segment.
+        estimator (str): See `amp_phi_fRF`.
+    """
+
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"'{estimator}' is not a valid estimator. Use one of {ESTIMATORS}.")
+
+    valid = ~np.isnan(values)
+
+    if values.shape[1] == 0:
+        return np.full(len(values), np.nan)
+
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+
+        warnings.simplefilter("ignore", RuntimeWarning)     # Segments without values give NaN.
+
+        if estimator == "peak":
+            return (np.nanmax(values, axis=1) - np.nanmin(values, axis=1)) / 2
+
+        if estimator == "rms":
+            return np.sqrt(2) * np.nanstd(values, axis=1)
+
+        centred = np.where(valid, values - np.nanmean(values, axis=1, keepdims=True), 0)
+
+        if estimator == "lockin":
+            reference = np.exp(-2j * np.pi * fRF[:, np.newaxis] * np.where(valid, t, 0))
+            return 2 * np.abs(np.sum(centred * reference, axis=1)) / valid.sum(axis=1)
+
+        envelope = np.abs(signal.hilbert(centred, axis=1))
+        return np.nanmedian(np.where(valid, envelope, np.nan), axis=1)
+
+
+def __steady_cutoff(
+    t: np.ndarray,
+    values: np.ndarray,
+    starts: np.ndarray,
+    fRF: np.ndarray,
+    periods: float = STEADY_PERIODS,
+    tolerance: float = STEADY_TOLERANCE
+) -> np.ndarray:
+    """Detects the end of the transient at the start of each segment.
+
+    Each segment is divided into windows of `periods` periods of its f_RF, and
+    the envelope of each window is its RMS about its mean, times sqrt(2). The
+    envelope is smoothed by a rolling median over `STEADY_SMOOTHING` windows,
+    so that noise and single-sample spikes do not count as transient. The last
+    window is not counted, as it may be incomplete.
+
+    The steady envelope of a segment is the median envelope of its second
+    half. The transient ends with the last window whose smoothed envelope
+    deviates from the steady envelope by more than `tolerance`, relative to
+    it. If fewer than `STEADY_MIN_PERIODS` periods would remain after it, the
+    transient is taken to last `SKIP_DURATION` instead.
 
     Args:
-        mag_var (str): The magnetization vector variable to calculate.
-          Acceptable values: "mx", "my", "mz".
+        t (numpy.ndarray): t relative to the start of each segment, for each
+          row. See `__segment_t`.
+        values (numpy.ndarray): The values for each row.
+        starts (numpy.ndarray): The first row of each segment.
+        fRF (numpy.ndarray): The f_RF of each segment.
+
+    Returns:
+        numpy.ndarray: The value of t after which the steady state begins, for
+          each segment.
     """
 
-    skip_duration = 1.5e-9
+    lengths = np.diff(np.append(starts, len(t)))
+    segment = np.repeat(np.arange(len(starts)), lengths)
+    window = np.floor(t * np.repeat(fRF, lengths) / periods)
 
-    data = read.read_data(paths.data.data_path(date,
-        {"phi": f"{phi:03}deg",
-        "f_RF": f"{fRF / 1e9}GHz"}
-    ))
+    window_starts = np.flatnonzero(np.concatenate((
+        [True], (segment[1:] != segment[:-1]) | (window[1:] != window[:-1]))))
+    window_lengths = np.diff(np.append(window_starts, len(t)))
 
-    operable_data = data.loc[data["t"] > skip_duration][mag_var]             #pylint: disable=E1136
+    mean = np.add.reduceat(values, window_starts) / window_lengths
+    deviation = values - np.repeat(mean, window_lengths)
+    envelope = np.sqrt(2 * np.add.reduceat(deviation**2, window_starts) / window_lengths)
 
-    #TODO: Find a better way of calculating amplitude of the graphs
-    amplitude = (operable_data.max() - operable_data.min()) / 2
+    # Gathers the windows into a 2-D array with a row per segment.
+    window_index = __pad_index(
+        np.ones(len(window_starts), dtype=bool),
+        np.searchsorted(segment[window_starts], np.arange(len(starts)))
+    )
+    envelope = __pad(envelope, window_index)
+    window_t = __pad(t[window_starts], window_index)
+
+    counts = np.sum(~np.isnan(window_t), axis=1, keepdims=True)
+    position = np.arange(envelope.shape[1])
+    envelope[position >= counts - 1] = np.nan
+
+    with warnings.catch_warnings():
+
+        warnings.simplefilter("ignore", RuntimeWarning)     # Segments without windows give NaN.
+
+        steady = np.nanmedian(np.where(position >= counts // 2, envelope, np.nan), axis=1)
+
+        half = STEADY_SMOOTHING // 2
+        envelope = np.nanmedian(np.lib.stride_tricks.sliding_window_view(
+            np.pad(envelope, ((0, 0), (half, half)), constant_values=np.nan),
+            STEADY_SMOOTHING,
+            axis=1
+        ), axis=2)
+
+    transient = (np.abs(envelope - steady[:, np.newaxis]) > tolerance * steady[:, np.newaxis]) \
+        & (position < counts - 1)
 
-    return amplitude
+    last_transient = envelope.shape[1] - 1 - np.argmax(transient[:, ::-1], axis=1)
+    cutoff_window = np.where(transient.any(axis=1), last_transient + 1, 0)
+    cutoff = window_t[np.arange(len(starts)), cutoff_window]
+
+    remaining = (t[starts + lengths - 1] - cutoff) * fRF
+
+    return np.where(remaining >= STEADY_MIN_PERIODS, cutoff, SKIP_DURATION)
+
+
+def __phi_runs(phi: np.ndarray, phi_starts: np.ndarray) -> tuple[np.ndarray, list[str]]:
+    """Finds the runs of phi which contain each segment, given the first row of
+    the run of phi of each segment (see `__segments`).
+
+    Returns:
+        tuple[numpy.ndarray, list[str]]: The run of phi of each segment, and
+          the name of each run: its value of phi in degrees, suffixed with its
+          run number for that value if it is not the first, as in the data
+          files of `split.split_phi`.
+    """
 
+    run_starts, segment_run = np.unique(phi_starts, return_inverse=True)
+    run_phi = phi[run_starts]
+    run_numbers = pd.Series(run_phi).groupby(run_phi, sort=False).cumcount() + 1
 
-def amp_phi_fRF(date: str = None):
+    return segment_run, [
+        f"{phi_val}deg" if run == 1 else f"{phi_val}deg_run{run}"
+        for phi_val, run in zip(run_phi, run_numbers)
+    ]
+
+
+def __write_segments(
+    values: np.ndarray,
+    layout: np.ndarray,
+    fRF_vals: np.ndarray,
+    names: list[str],
+    path: str
+):
+    """Writes a value of each segment to a table with a row per value of f_RF
+    and a column per run of phi, given the segment in each cell, or -1 where
+    there is none.
+    """
+
+    table = np.column_stack([fRF_vals, np.where(layout >= 0, values[layout], np.nan)])
+
+    pd.DataFrame(table, columns=["f_RF", *names]).to_csv(path, sep='\t', index=False)
+
+
+def amp_phi_fRF(
+    date: str = None,
+    mapped: bool = False,
+    skip_duration: float = SKIP_DURATION,
+    estimator: str = "peak"
+):
     """Finds the amplitude for all the split datasets, for all magnetization
     components.
+
+    The amplitudes of all segments of the table, as split by
+    `split.split_phi_fRF`, are found in one pass over the table rather than by
+    reading each split data file. The samples of consecutive segments are
+    gathered into 2-D arrays with a row per segment, of at most `BATCH_ROWS`
+    values each, so each estimator is computed for a batch of segments at
+    once.
+
+    Each run of phi has a column, named as its data files are named by
+    `split.split_phi`, so a value of phi which recurs has a column for each
+    run. If a value of f_RF recurs within a run of phi, the first run of it
+    is used, with a warning.
+
+    Args:
+        mapped (bool): Whether to memory-map the table instead of reading it
+          into memory. See `read.map_data`. Only a batch of segments is then
+          held in memory at a time.
+        skip_duration (float): The duration, in seconds, at the start of each
+          segment which is excluded as transient. If None, the transient of
+          each segment is detected from the convergence of its envelope (see
+          `STEADY_PERIODS` and the constants after it), separately for each
+          magnetization component, and the time at which it ends is written
+          to the cutoff data (see `paths.calcvals.cutoff_path`).
+        estimator (str): The method of estimating the amplitude of a segment:
+          * "peak": half the difference between the maximum and minimum.
+          * "rms": the root mean square about the mean, times sqrt(2).
+          * "lockin": the magnitude of the Fourier component at f_RF.
+          * "hilbert": the median of the envelope from the Hilbert transform.
+          "peak" is sensitive to single-sample spikes, which the others
+          average out. All give the amplitude of a pure sinusoid.
     """
 
     date = date if date is not None else paths.top.latest_date()
-    data = read.read_data(paths.data.data_path(date))
+    data = __read_sweep(date, mapped, ["t", "phi", "f_RF", *MAG_VARS])
+
+    # Views of the columns, which are only read a batch at a time if mapped.
+    data = {name: np.asarray(data[name]) for name in ["t", "phi", "f_RF", *MAG_VARS]}
+    phi, fRF = data["phi"], data["f_RF"]
+
+    starts, phi_starts = __segments(phi, fRF)
+    ends = np.append(starts[1:], len(phi))
 
-    for mag_var in ("mx", "my", "mz"):
+    # The cell of each segment: its value of f_RF and its run of phi.
+    segment_run, names = __phi_runs(phi, phi_starts)
+    fRF_vals = pd.unique(fRF[starts])
+    segment_row = pd.Index(fRF_vals).get_indexer(fRF[starts])
 
-        amplitudes = np.reshape(np.array(data["f_RF"].unique()), newshape=(-1, 1))
+    repeated = pd.DataFrame({"run": segment_run, "row": segment_row}).duplicated().to_numpy()
+    if repeated.any():
+        warnings.warn(f"{repeated.sum()} segments repeat a value of f_RF within their run of phi"
+            " and are not written to the amplitude data; the first run of each value is used.")
 
-        # Appends the amplitude data for each phi value.
-        for phi in data["phi"].unique():
-            col = np.array([__calc_amp(date, phi, fRF, mag_var) for fRF in data["f_RF"].unique()])
-            amplitudes = np.append(amplitudes, np.reshape(col, newshape=(-1, 1)), axis=1)
+    layout = np.full((len(fRF_vals), len(names)), -1)
+    layout[segment_row[~repeated], segment_run[~repeated]] = np.flatnonzero(~repeated)
 
-        write.prep_dir(paths.calcvals.root(date), clear=False)
+    amps = {mag_var: np.empty(len(starts)) for mag_var in MAG_VARS}
+    cutoffs = {mag_var: np.full(len(starts), skip_duration, dtype=float) for mag_var in MAG_VARS}
+
+    for batch in (slice(*i) for i in __batches(ends - starts, BATCH_ROWS)):
+
+        rows = slice(starts[batch][0], ends[batch][-1])
+        batch_starts = starts[batch] - starts[batch][0]
+        batch_fRF = fRF[starts[batch]]
+
+        t = __segment_t(data["t"][rows], batch_starts, data["t"][phi_starts[batch]])
+        lengths = ends[batch] - starts[batch]
+
+        for mag_var in MAG_VARS:
+
+            values = data[mag_var][rows]
+
+            if skip_duration is None:
+                cutoffs[mag_var][batch] = __steady_cutoff(t, values, batch_starts, batch_fRF)
+
+            index = __pad_index(t > np.repeat(cutoffs[mag_var][batch], lengths), batch_starts)
+            amps[mag_var][batch] = __estimate_amp(
+                __pad(values, index), __pad(t, index), batch_fRF, estimator)
+
+    write.prep_dir(paths.calcvals.root(date), clear=False)
+
+    for mag_var in MAG_VARS:
+
+        if skip_duration is None:
+            __write_segments(cutoffs[mag_var], layout, fRF_vals, names,
+                paths.calcvals.cutoff_path(mag_var, date))
 
         # Outputs amplitude data.
-        pd.DataFrame(amplitudes, columns=["f_RF", *[f"{i}deg" for i in data["phi"].unique()]]) \
-            .to_csv(paths.calcvals.amp_path(mag_var, date), sep='\t', index=False)
+        __write_segments(amps[mag_var], layout, fRF_vals, names,
+            paths.calcvals.amp_path(mag_var, date))
 
 
-def max_amp_phi(date: str = None):
-    """Finds the maximum amplitudes for each phi value."""
+def max_amp_phi(date: str = None, mapped: bool = False):
+    """Finds the maximum amplitudes for each run of phi, as written by
+    `amp_phi_fRF`. See `amp_phi_fRF` for `mapped`.
+    """
 
     date = date if date is not None else paths.top.latest_date()
 
-    # .T transposes the ndarray to a column vector.
-    result = np.reshape(
-        np.array( ( read.read_data(paths.data.data_path(date))["phi"] ).unique() ),
-        newshape=(-1, 1)
-    )
+    phi = np.asarray(__read_sweep(date, mapped, ["phi"])["phi"])
+    phi_vals = phi[__segments(phi, phi)[0]]
+    max_cols = []
 
-    mag_vars = ("mx", "my", "mz")
-    for var in mag_vars:
+    for var in MAG_VARS:
 
-        # Reads the greatest amp for each value of phi.
+        # Reads the greatest amp for each run of phi.
         data = read.read_data(paths.calcvals.amp_path(var, date))
-        max_col = np.array([data[val].max() for val in data.columns[1:]])
-
-        result = np.append(result, np.reshape(max_col, newshape=(-1, 1)), axis=1)
+        max_cols.append(np.array([data[val].max() for val in data.columns[1:]]))
 
     # Outputs to data file.
-    pd.DataFrame(result, columns=(["phi"] + list(f"MaxAmp_{i}" for i in mag_vars))) \
+    pd.DataFrame(np.column_stack([phi_vals, *max_cols]),
+        columns=(["phi"] + list(f"MaxAmp_{i}" for i in MAG_VARS))) \
         .to_csv(paths.calcvals.maxamp_path(date), sep='\t', index=False)
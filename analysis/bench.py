@@ -0,0 +1,67 @@
+"""Benchmarks the parsers used to read data files."""
+
+import os
+from time import perf_counter
+
+from analysis import read
+
+
+def bench_read(path: str, engines: list[str] = None, repeat: int = 3) -> dict[str, float]:
+    """Times reading a data file with each parser.
+
+    The in-memory and columnar caches are bypassed, so every read parses the
+    data file.
+
+    Args:
+        path (str): The path of the data file.
+        engines (list[str]): The parsers to time. See `read.csv_engine`.
+          Defaults to "c", and "pyarrow" if it is installed.
+        repeat (int): The number of times to read the data file with each
+          parser. The fastest read is reported.
+
+    Returns:
+        dict[str, float]: The fastest read time, in seconds, for each parser
+          that ran. Parsers are resolved with `read.csv_engine`, so a parser
+          which is not installed is timed as the parser it falls back to,
+          and each parser is only timed once.
+    """
+
+    if engines is None:
+        engines = ["c", "pyarrow"] if read.csv_engine("auto") == "pyarrow" else ["c"]
+
+    times = {}
+
+    for engine in dict.fromkeys(read.csv_engine(i) for i in engines):
+
+        best = float("inf")
+
+        for _ in range(repeat):
+            t_start = perf_counter()
+            read.read_data(path, cache=False, engine=engine)
+            best = min(best, perf_counter() - t_start)
+
+        times[engine] = best
+
+    return times
+
+
+def report_read(path: str, engines: list[str] = None, repeat: int = 3) -> str:
+    """Benchmarks reading a data file (see `bench_read`) and returns a summary
+    of the read time and throughput of each parser that ran. Requested
+    parsers which are not installed are listed as such.
+    """
+
+    size = os.path.getsize(path) / 2**20
+    times = bench_read(path, engines, repeat)
+
+    return "\n".join([
+        *[
+            f"{engine}: {seconds:.3f}s ({size / seconds:.1f} MiB/s)"
+            + ("" if engine == "c" or "c" not in times else f", {times['c'] / seconds:.2f}x c")
+            for engine, seconds in times.items()
+        ],
+        *[
+            f"{engine}: not installed"
+            for engine in dict.fromkeys(engines or []) if engine not in ("auto", *times)
+        ]
+    ])
@@ -0,0 +1,271 @@
+"""Defines the command line options which tune how analyses read, split,
+calculate, and plot data, for `analysis.__main__`.
+
+The options of the resonance command are collected in `ResonanceOptions`, so
+that they can be passed to the analyses as one object.
+"""
+
+import argparse
+from dataclasses import dataclass, fields
+
+from analysis import amplitude, framecache, read
+
+
+def parse_duration(value: str) -> float | None:
+    """Parses a duration in seconds, or "auto" as None."""
+
+    if value == "auto":
+        return None
+
+    try:
+        return float(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a valid duration, e.g. 2e-9") from err
+
+
+def parse_size(value: str) -> int:
+    """Parses a size in bytes, with an optional K, M, or G suffix."""
+
+    units = {"K": 2**10, "M": 2**20, "G": 2**30}
+
+    try:
+        if value[-1:].upper() in units:
+            return int(float(value[:-1]) * units[value[-1].upper()])
+        return int(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a valid size, e.g. 512M") from err
+
+
+def add_top_options(parser: argparse.ArgumentParser) -> dict[str, tuple[argparse.Action, tuple]]:
+    """Adds the top-level options which tune reading and plotting.
+
+    Returns:
+        dict[str, tuple[argparse.Action, tuple]]: The options whose values must
+          be one of a set, keyed by their destination, with their argument
+          object and their acceptable values.
+    """
+
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=parse_size,
+        default=framecache.DEFAULT_MAX_BYTES,
+        help="the maximum size of data kept in memory between analyses (e.g. 512M, 2G), defaults"
+            + " to 1G"
+    )
+
+    argobj_csv_engine = parser.add_argument(
+        "--csv-engine",
+        dest="csv_engine",
+        type=str,
+        default=None,
+        help="the parser used to read data files, any of: c pyarrow auto, defaults to the"
+            + f" {read.CSV_ENGINE_ENV} environment variable, or c"
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="regenerates every plot, including plots which are up to date with their data"
+    )
+
+    return {"csv_engine": (argobj_csv_engine, ("c", "pyarrow", "auto"))}
+
+
+@dataclass
+class ResonanceOptions:                                                #pylint: disable=R0902
+    """Options of the resonance command which tune how the table is read and
+    split, how amplitudes are calculated and curve-fitted, and how plots are
+    rendered. See `add_resonance_options` for each option.
+    """
+
+    memory_map: bool = False
+    max_memory: int = None
+    workers: int = 1
+    pool: str = "thread"
+    split_store: bool = False
+    split_workers: int = 1
+    incremental: bool = False
+    skip_duration: float = amplitude.SKIP_DURATION
+    amp_estimator: str = "peak"
+    fit_workers: int = 1
+    bootstrap: int = 0
+    max_peaks: int = 1
+    render_workers: int = 1
+    max_points: int = None
+    plot_output: str = "files"
+    sheet_panels: int = 16
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace):
+        """Collects the options from parsed arguments."""
+        return cls(**{field.name: getattr(args, field.name) for field in fields(cls)})
+
+    def describe(self) -> list[str]:
+        """Returns a line for each option, with its name on the command line
+        and its value.
+        """
+        return [f"{field.name.replace('_', '-')}: {repr(getattr(self, field.name))}"
+            for field in fields(self)]
+
+
+def add_resonance_options(
+    parser: argparse.ArgumentParser
+) -> dict[str, tuple[argparse.Action, tuple]]:
+    """Adds the options of the resonance command collected in
+    `ResonanceOptions`.
+
+    Returns:
+        dict[str, tuple[argparse.Action, tuple]]: The options whose values must
+          be one of a set. See `add_top_options`.
+    """
+
+    defaults = ResonanceOptions()
+
+    parser.add_argument(
+        "--memory-map",
+        dest="memory_map",
+        action="store_true",
+        help="memory-maps the table instead of reading it into memory, for tables too large to fit"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=defaults.workers,
+        help="the number of split data files to read ahead of plotting, defaults to 1"
+    )
+
+    argobj_pool = parser.add_argument(
+        "--pool",
+        type=str,
+        required=False,
+        default=defaults.pool,
+        help="the type of worker pool used with --workers, any of: thread process, defaults to"
+            + " thread"
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        dest="max_memory",
+        type=parse_size,
+        required=False,
+        default=defaults.max_memory,
+        help="the approximate memory to use when splitting the table (e.g. 512M, 2G), defaults to"
+            + " reading the whole table"
+    )
+
+    parser.add_argument(
+        "--split-store",
+        dest="split_store",
+        action="store_true",
+        help="writes each split level to a single indexed file instead of a data file per split"
+    )
+
+    parser.add_argument(
+        "--split-workers",
+        dest="split_workers",
+        type=int,
+        required=False,
+        default=defaults.split_workers,
+        help="the number of processes writing split data files, defaults to 1"
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only splits rows added to the table since its last incremental split"
+    )
+
+    parser.add_argument(
+        "--skip-duration",
+        dest="skip_duration",
+        type=parse_duration,
+        required=False,
+        default=defaults.skip_duration,
+        help="the duration (s) of the transient excluded from each amplitude, or auto to detect"
+            + f" the steady state of each segment, defaults to {amplitude.SKIP_DURATION}"
+    )
+
+    parser.add_argument(
+        "--fit-workers",
+        dest="fit_workers",
+        type=int,
+        required=False,
+        default=defaults.fit_workers,
+        help="the number of processes curve-fitting amplitudes, defaults to 1"
+    )
+
+    argobj_estimator = parser.add_argument(
+        "--amp-estimator",
+        dest="amp_estimator",
+        type=str,
+        required=False,
+        default=defaults.amp_estimator,
+        help="the method of estimating amplitudes, any of: peak rms lockin hilbert, defaults to"
+            + " peak"
+    )
+
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        required=False,
+        default=defaults.bootstrap,
+        help="the number of bootstrap resamples for confidence intervals of curve-fits, defaults"
+            + " to 0 (none)"
+    )
+
+    parser.add_argument(
+        "--max-peaks",
+        dest="max_peaks",
+        type=int,
+        required=False,
+        default=defaults.max_peaks,
+        help="also curve-fits amplitudes to sums of up to this many peaks if greater than 1,"
+            + " defaults to 1"
+    )
+
+    parser.add_argument(
+        "--render-workers",
+        dest="render_workers",
+        type=int,
+        required=False,
+        default=defaults.render_workers,
+        help="the number of processes rendering plots of split data files, defaults to 1"
+    )
+
+    parser.add_argument(
+        "--max-points",
+        dest="max_points",
+        type=int,
+        required=False,
+        default=defaults.max_points,
+        help="the number of points each plotted line is decimated to, keeping peaks and"
+            + " envelopes (e.g. 4000), defaults to plotting every point"
+    )
+
+    argobj_plot_output = parser.add_argument(
+        "--plot-output",
+        dest="plot_output",
+        type=str,
+        required=False,
+        default=defaults.plot_output,
+        help="how plots of split data files are written, any of: files (a PDF per plot) pdf (one"
+            + " multi-page PDF) sheet (PNG contact sheets), defaults to files"
+    )
+
+    parser.add_argument(
+        "--sheet-panels",
+        dest="sheet_panels",
+        type=int,
+        required=False,
+        default=defaults.sheet_panels,
+        help="the number of plots on each contact sheet with --plot-output sheet, defaults to 16"
+    )
+
+    return {
+        "pool": (argobj_pool, ("thread", "process")),
+        "amp_estimator": (argobj_estimator, amplitude.ESTIMATORS),
+        "plot_output": (argobj_plot_output, ("files", "pdf", "sheet"))
+    }
@@ -0,0 +1,343 @@
+"""Reads and writes the binary columnar format used to cache data files.
+
+A columnar file stores a numeric table column by column, so that it can be
+read back without parsing text. The layout is:
+* 8 bytes: the magic string `MAGIC`.
+* 8 bytes: the length of the header, as a little-endian unsigned integer.
+* The header, as UTF-8 encoded JSON, padded with spaces so that the column
+  data begins on an `ALIGNMENT`-byte boundary.
+* The column data. Each column is a contiguous array whose offset (relative
+  to the start of the column data) is aligned to `ALIGNMENT` bytes.
+
+The header contains the column names, their numpy dtype strings, the number of
+rows, the offset of each column, and optionally the size and modification time
+of the data file from which the columns were built, and any other metadata
+given by the writer.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"ANLCOLS1"
+ALIGNMENT = 64
+
+
+def __align(size: int) -> int:
+    """Rounds a size up to the next multiple of `ALIGNMENT`."""
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def source_stamp(path: str) -> dict[str, int]:
+    """Returns the size and modification time of a file, used to check if a
+    columnar file is up to date with the file it was built from.
+    """
+
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def __header_bytes(
+    names: list[str],
+    dtypes: list[np.dtype],
+    rows: int,
+    source: str = None,
+    meta: dict = None
+) -> tuple[bytes, list[int], int]:
+    """Builds the header of a columnar file.
+
+    Returns:
+        tuple: The padded header bytes, the offset of each column relative to
+          the start of the column data, and the total size of the column data.
+    """
+
+    offsets = []
+    data_size = 0
+    for dtype in dtypes:
+        offsets.append(data_size)
+        data_size = __align(data_size + dtype.itemsize * rows)
+
+    header = {
+        "names": list(names),
+        "dtypes": [dtype.str for dtype in dtypes],
+        "rows": rows,
+        "offsets": offsets,
+        "source": source_stamp(source) if source is not None else None,
+        "meta": meta
+    }
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b' ' * (__align(len(header_bytes) + 16) - len(header_bytes) - 16)
+
+    return MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes, offsets, data_size
+
+
+def write_columns(
+    path: str,
+    columns: dict[str, np.ndarray],
+    source: str = None,
+    meta: dict = None
+):
+    """Writes columns to a columnar file.
+
+    The file is written to a temporary path and then renamed, so that readers
+    never see a partially written file.
+
+    Args:
+        path (str): The path of the columnar file.
+        columns (dict[str, numpy.ndarray]): An ordered dict of column names and
+          their one-dimensional numeric data. All columns must have the same
+          length.
+        source (str): The path of the data file from which the columns were
+          built. If given, its size and modification time are recorded, and
+          can be checked with `is_fresh`.
+        meta (dict): Metadata to be stored in the header. Must be JSON
+          serializable.
+    """
+
+    arrays = [np.ascontiguousarray(col) for col in columns.values()]
+
+    if len({len(arr) for arr in arrays}) > 1:
+        raise ValueError("All columns must have the same length.")
+
+    header, offsets, data_size = __header_bytes(
+        columns.keys(),
+        [arr.dtype for arr in arrays],
+        len(arrays[0]) if arrays else 0,
+        source,
+        meta
+    )
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+
+        with open(temp_path, 'wb') as file:
+
+            file.write(header)
+
+            for arr, offset in zip(arrays, offsets):
+                file.seek(len(header) + offset)
+                arr.tofile(file)
+
+            file.truncate(len(header) + data_size)
+
+        os.replace(temp_path, path)
+
+    finally:
+
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class ColumnWriter:
+    """Writes a columnar file from batches of rows, without holding the whole
+    table in memory.
+
+    Each column is spooled to its own temporary file as batches are appended.
+    The columnar file is assembled from the spools when the writer is closed.
+    If used as a context manager, the spools are discarded if an exception is
+    raised before the writer is closed.
+
+    Args:
+        path (str): The path of the columnar file.
+        names (list[str]): The names of the columns, in order.
+    """
+
+    def __init__(self, path: str, names: list[str]):
+
+        self.path = path
+        self.names = list(names)
+        self.dtypes = None
+        self.rows = 0
+
+        self.__spool_paths = [f"{path}.{os.getpid()}.{i}.tmp" for i in range(len(self.names))]
+        self.__spools = [open(i, 'wb') for i in self.__spool_paths]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+
+    def append(self, columns: dict[str, np.ndarray]):
+        """Appends a batch of rows, given as a dict of column names and data.
+        All columns in `names` must be present and have the same length.
+        """
+
+        arrays = [np.asarray(columns[name]) for name in self.names]
+
+        if len({len(arr) for arr in arrays}) > 1:
+            raise ValueError("All columns must have the same length.")
+
+        if self.dtypes is None:
+            self.dtypes = [arr.dtype for arr in arrays]
+
+        for i, arr in enumerate(arrays):
+
+            # A column parsed as integers in earlier batches may hold floats
+            # in a later one.
+            dtype = np.result_type(self.dtypes[i], arr.dtype)
+            if dtype != self.dtypes[i]:
+                self.__widen(i, dtype)
+
+            np.ascontiguousarray(arr.astype(dtype, copy=False)).tofile(self.__spools[i])
+
+        self.rows += len(arrays[0]) if arrays else 0
+
+    def __widen(self, i: int, dtype: np.dtype):
+        """Rewrites the spool of column `i` with a wider dtype."""
+
+        self.__spools[i].close()
+
+        widened_path = f"{self.__spool_paths[i]}.widen"
+
+        with open(self.__spool_paths[i], 'rb') as spool, open(widened_path, 'wb') as widened:
+            while True:
+                block = np.fromfile(spool, dtype=self.dtypes[i], count=2**20)
+                if block.size == 0:
+                    break
+                block.astype(dtype).tofile(widened)
+
+        os.replace(widened_path, self.__spool_paths[i])
+
+        self.__spools[i] = open(self.__spool_paths[i], 'ab')   #pylint: disable=consider-using-with
+        self.dtypes[i] = dtype
+
+    def close(self, source: str = None, meta: dict = None):
+        """Assembles the columnar file from the spools. See `write_columns` for
+        `source` and `meta`.
+
+        The spools are memory-mapped and written with `write_columns`, so they
+        are copied without being read into memory.
+        """
+
+        for spool in self.__spools:
+            spool.close()
+
+        dtypes = self.dtypes if self.dtypes is not None else [np.dtype(float)] * len(self.names)
+
+        try:
+            write_columns(
+                self.path,
+                {
+                    name: np.memmap(spool_path, dtype=dtype, mode='r') if self.rows > 0
+                        else np.empty(0, dtype=dtype)
+                    for name, dtype, spool_path in zip(self.names, dtypes, self.__spool_paths)
+                },
+                source,
+                meta
+            )
+        finally:
+            self.discard()
+
+    def discard(self):
+        """Closes and removes the spools without writing the columnar file."""
+
+        for spool in self.__spools:
+            spool.close()
+
+        for spool_path in self.__spool_paths:
+            if os.path.exists(spool_path):
+                os.remove(spool_path)
+
+
+def read_header(path: str) -> dict:
+    """Reads the header of a columnar file.
+
+    The returned dict also contains the key "data_start", the absolute offset
+    at which the column data begins.
+    """
+
+    with open(path, 'rb') as file:
+
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a columnar file.")
+
+        header_len = struct.unpack("<Q", file.read(8))[0]
+        header = json.loads(file.read(header_len).decode("utf-8"))
+
+    header["data_start"] = 16 + header_len
+
+    return header
+
+
+def read_columns(path: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """Reads columns from a columnar file.
+
+    Args:
+        path (str): The path of the columnar file.
+        columns (list[str]): The names of the columns to read. If not given,
+          all columns are read.
+
+    Returns:
+        dict[str, numpy.ndarray]: An ordered dict of column names and data.
+    """
+
+    header = read_header(path)
+    columns = columns if columns is not None else header["names"]
+
+    result = {}
+
+    with open(path, 'rb') as file:
+        for name in columns:
+
+            i = header["names"].index(name)
+            file.seek(header["data_start"] + header["offsets"][i])
+
+            result[name] = np.fromfile(file, dtype=header["dtypes"][i], count=header["rows"])
+
+    return result
+
+
+def map_columns(path: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """Maps columns from a columnar file into memory.
+
+    The file is memory-mapped read-only, and each column is a zero-copy view
+    into the mapping. Data is only read from disk when it is accessed.
+
+    Args:
+        path (str): The path of the columnar file.
+        columns (list[str]): The names of the columns to map. If not given,
+          all columns are mapped.
+
+    Returns:
+        dict[str, numpy.ndarray]: An ordered dict of column names and
+          read-only views of their data.
+    """
+
+    header = read_header(path)
+    columns = columns if columns is not None else header["names"]
+
+    if header["rows"] == 0:
+        return {
+            name: np.empty(0, dtype=header["dtypes"][header["names"].index(name)])
+            for name in columns
+        }
+
+    mapping = np.memmap(path, dtype=np.uint8, mode='r')
+
+    result = {}
+    for name in columns:
+
+        i = header["names"].index(name)
+        dtype = np.dtype(header["dtypes"][i])
+        start = header["data_start"] + header["offsets"][i]
+
+        result[name] = mapping[start : start + dtype.itemsize * header["rows"]].view(dtype)
+
+    return result
+
+
+def is_fresh(path: str, source: str) -> bool:
+    """Checks if a columnar file exists and was built from the current version
+    of `source`.
+    """
+
+    try:
+        return read_header(path)["source"] == source_stamp(source)
+    except (OSError, ValueError, struct.error):
+        return False
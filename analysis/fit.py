@@ -1,11 +1,24 @@
 """Calculates curve-fitting values for amplitude data."""
 
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 from scipy.optimize import curve_fit
 
 from analysis import paths, read
 
+# The information criteria by which the number of peaks is chosen. See `fit_peak_columns`.
+CRITERIA = ("bic", "aicc")
+
+# The least height of a peak, relative to the highest peak of its column, which is not taken to
+# fit the residual of the other peaks. See `fit_peak_columns`.
+MIN_PEAK_FRACTION = 0.01
+
+# The number of consecutive columns of phi fitted as one work item by `fit_cauchy_batch`. Columns
+# are warm-started within a chunk, so the chunks, and the fits, do not depend on the workers.
+CHUNK_COLUMNS = 32
+
 
 def cauchy(x, x0, gamma, I):                                          #pylint: disable=invalid-name
     """Cauchy distribution curve-fitting function.
@@ -20,14 +33,574 @@ def cauchy(x, x0, gamma, I):                                          #pylint: d
     return I * ( np.square(gamma) / ( np.square(x - x0) + np.square(gamma) ) )
 
 
+def cauchy_jac(x, x0, gamma, I):                                      #pylint: disable=invalid-name
+    """The Jacobian of `cauchy` with respect to its fitting parameters.
+
+    Returns:
+        numpy.ndarray: The partial derivatives with respect to x_0, gamma,
+          and I, as columns, at each value of x.
+    """
+
+    dx = np.asarray(x, dtype=float) - x0
+    denom = np.square(dx) + np.square(gamma)
+
+    return np.column_stack((
+        2 * I * np.square(gamma) * dx / np.square(denom),
+        2 * I * gamma * np.square(dx) / np.square(denom),
+        np.square(gamma) / denom
+    ))
+
+
+def cauchy_guess(x: np.ndarray, y: np.ndarray) -> list[float]:
+    """Guesses the fitting parameters of `cauchy` from data: the peak
+    location and height from the greatest value, and the half-width from the
+    values above half of it.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    peak = np.nanargmax(y)
+    above = x[y >= y[peak] / 2]
+    half_width = (above.max() - above.min()) / 2
+
+    # A peak narrower than the spacing of x is given a width of one step.
+    if half_width == 0:
+        half_width = (x.max() - x.min()) / max(len(x) - 1, 1)
+
+    return [x[peak], half_width, y[peak]]
+
+
+def lorentzian_sum(x, *params):
+    """A sum of `cauchy` peaks, for curve-fitting spectra with several modes.
+
+    Args:
+        x: Independent variable.
+        params: The fitting parameters (x_0, gamma, I) of each peak in turn.
+          Peaks whose parameters are NaN are left out, so that fits with
+          different numbers of peaks can be read from one table (see
+          `fit_peaks`).
+    """
+
+    total = np.zeros(np.shape(x))
+
+    for x0, gamma, I in zip(*[iter(params)] * 3):                     #pylint: disable=invalid-name
+        if not np.isnan(I):
+            total = total + cauchy(x, x0, gamma, I)
+
+    return total
+
+
+def __fit_column(
+    x: np.ndarray,
+    y: np.ndarray,
+    guesses: list[list[float]]
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fits one column of amplitudes to `cauchy`, starting from each of
+    `guesses` in turn until a fit converges.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The fitting parameters, and their
+          standard deviations.
+
+    Raises:
+        RuntimeError: If no fit converges.
+    """
+
+    for i, guess in enumerate(guesses):
+        try:
+            popt, pcov = curve_fit(f=cauchy, xdata=x, ydata=y, p0=guess, jac=cauchy_jac)
+            return popt, np.sqrt(np.diag(pcov))
+        except RuntimeError:
+            if i == len(guesses) - 1:
+                raise
+
+    raise ValueError("No initial guesses were given.")
+
+
+def fit_columns(
+    x: np.ndarray,
+    columns: dict[str, np.ndarray],
+    p0: list[float] = None,                                           #pylint: disable=invalid-name
+    failures: dict[str, str] = None
+) -> pd.DataFrame:
+    """Fits columns of amplitudes to `cauchy`, in order.
+
+    Each column is warm-started from the fit of the column before it, which
+    is close for neighbouring values of phi. The first column, and any column
+    whose warm start does not converge, starts from `p0` if given, and then
+    from `cauchy_guess`.
+
+    Args:
+        x (numpy.ndarray): The values of f_RF.
+        columns (dict[str, numpy.ndarray]): An ordered dict of the name of
+          each column and its amplitudes at each value of `x`.
+        p0 (list[float]): See `fit_cauchy`.
+        failures (dict[str, str]): If given, a column whose fit fails is added
+          to it with its error message, and its parameters are NaN, instead
+          of raising the error. The next column is not warm-started.
+
+    Returns:
+        pandas.DataFrame: The fitting parameters of each column, and their
+          standard deviations, as written by `fit_cauchy`.
+    """
+
+    x = np.asarray(x, dtype=float)
+    rows = []
+    warm_start = None
+
+    for name, y in columns.items():
+
+        y = np.asarray(y, dtype=float)
+
+        try:
+            popt, perr = __fit_column(
+                x, y, [i for i in (warm_start, p0) if i is not None] + [cauchy_guess(x, y)])
+        except (RuntimeError, TypeError, ValueError) as error:
+            if failures is None:
+                raise
+            failures[name] = str(error)
+            rows.append([name, *[np.nan] * 6])
+            warm_start = None
+            continue
+
+        rows.append([name, *popt, *perr])
+        warm_start = list(popt)
+
+    return pd.DataFrame(
+        rows, columns=["phi", "x_0", "gamma", "I", "sigma_x_0", "sigma_gamma", "sigma_I"])
+
+
+def __guess_peak(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Guesses the parameters of a peak in each row of `y`, as `cauchy_guess`.
+
+    Returns:
+        numpy.ndarray: The parameters (x_0, gamma, I) of each row.
+    """
+
+    peak = np.argmax(y, axis=1)
+    height = y[np.arange(len(y)), peak]
+    above = y >= height[:, np.newaxis] / 2
+
+    half_width = (np.where(above, x, -np.inf).max(axis=1)
+        - np.where(above, x, np.inf).min(axis=1)) / 2
+    half_width = np.where(half_width > 0, half_width, (x.max() - x.min()) / max(len(x) - 1, 1))
+
+    return np.column_stack((x[peak], half_width, height))
+
+
+def __guess_peaks(x: np.ndarray, y: np.ndarray, n_peaks: int) -> np.ndarray:
+    """Guesses the parameters of `n_peaks` peaks in each row of `y`, from its
+    largest local maxima. Each peak's half-width is from the values around it
+    above half of its height, and maxima within the half-width of a larger
+    peak are passed over, so that noise on a peak is not guessed as another
+    peak.
+
+    Returns:
+        numpy.ndarray: The parameters (x_0, gamma, I) of each peak of each
+          row, of shape (rows, `n_peaks`, 3). Peaks beyond the number of
+          separate maxima in a row are NaN.
+    """
+
+    step = (x.max() - x.min()) / max(len(x) - 1, 1)
+    guesses = np.full((len(y), n_peaks, 3), np.nan)
+    rows, index = np.arange(len(y)), np.arange(y.shape[1])
+
+    padded = np.pad(y, ((0, 0), (1, 1)), constant_values=-np.inf)
+    candidates = np.where((y >= padded[:, :-2]) & (y >= padded[:, 2:]) & (y > 0), y, -np.inf)
+
+    # Takes the largest remaining maximum of each row, and passes over the maxima around it.
+    for i in range(n_peaks):
+
+        peak = np.argmax(candidates, axis=1)
+        height = candidates[rows, peak]
+        found = np.isfinite(height)
+
+        below = y < height[:, np.newaxis] / 2
+        low = np.where(below & (index < peak[:, np.newaxis]), index, -1).max(axis=1) + 1
+        high = np.where(below & (index > peak[:, np.newaxis]), index, len(index)).min(axis=1) - 1
+
+        guesses[found, i] = np.column_stack(
+            (x[peak], np.maximum((x[high] - x[low]) / 2, step), height))[found]
+        candidates[(index >= low[:, np.newaxis]) & (index <= high[:, np.newaxis])] = -np.inf
+
+    return guesses
+
+
+def __peaks_model(x: np.ndarray, params: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Evaluates a sum of `cauchy` peaks and its Jacobian for a batch of
+    columns.
+
+    Args:
+        x (numpy.ndarray): The values of x, of shape (points,).
+        params (numpy.ndarray): The parameters (x_0, gamma, I) of each peak of
+          each column, of shape (columns, peaks, 3).
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The values, of shape (columns,
+          points), and the Jacobian, of shape (columns, points, peaks * 3).
+    """
+
+    x0, gamma, height = (params[..., i, np.newaxis] for i in range(3))
+
+    dx = x - x0
+    denom = np.square(dx) + np.square(gamma)
+    shape = np.square(gamma) / denom
+
+    jac = np.stack((
+        2 * height * shape * dx / denom,
+        2 * height * shape * np.square(dx) / (gamma * denom),
+        shape
+    ), axis=2)
+
+    return np.sum(height * shape, axis=1), jac.reshape(len(params), -1, len(x)).transpose(0, 2, 1)
+
+
+def __batched_lm(
+    x: np.ndarray,
+    y: np.ndarray,
+    params: np.ndarray,
+    max_iter: int = 50,
+    tol: float = 1e-8
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fits a sum of `cauchy` peaks to every column at once, by the
+    Levenberg-Marquardt method with a damping factor for each column.
+
+    x and y should be scaled to the order of 1, for the normal equations to
+    be well conditioned.
+
+    Args:
+        x (numpy.ndarray): The values of x, of shape (points,).
+        y (numpy.ndarray): The values of each column, of shape (columns,
+          points).
+        params (numpy.ndarray): The initial parameters. See `__peaks_model`.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]: The fitted
+          parameters, the residual sum of squares of each column, and the
+          Jacobian at the fitted parameters.
+    """
+
+    params = params.copy()
+    n_params = params.shape[1] * 3
+    identity = np.eye(n_params)
+
+    model, jac = __peaks_model(x, params)
+    cost = np.sum(np.square(y - model), axis=1)
+    damping = np.full(len(y), 1e-3)
+    active = np.isfinite(cost)
+
+    for _ in range(max_iter):
+
+        # Steps only the columns that have not converged.
+        i = np.flatnonzero(active)
+        if i.size == 0:
+            break
+
+        jtj = np.einsum('cmi,cmj->cij', jac[i], jac[i])
+        gradient = np.einsum('cmi,cm->ci', jac[i], y[i] - model[i])
+        lhs = jtj + (damping[i, np.newaxis, np.newaxis] * jtj + 1e-12) * identity
+
+        step = np.linalg.solve(lhs, gradient[..., np.newaxis])[..., 0]
+        trial = params[i] + step.reshape(params[i].shape)
+
+        trial_model, trial_jac = __peaks_model(x, trial)
+        trial_cost = np.sum(np.square(y[i] - trial_model), axis=1)
+
+        better = trial_cost < cost[i]
+        converged = better & (
+            (cost[i] - trial_cost <= tol * cost[i])
+            | (np.linalg.norm(step, axis=1) <= tol * np.linalg.norm(params[i], axis=(1, 2)))
+        )
+
+        j = i[better]
+        params[j], model[j], jac[j], cost[j] = (
+            trial[better], trial_model[better], trial_jac[better], trial_cost[better]
+        )
+
+        damping[i] = np.where(better, damping[i] / 10, damping[i] * 10)
+        active[i] = ~converged & (damping[i] < 1e12)
+
+    return params, cost, jac
+
+
+def __spurious(x: np.ndarray, params: np.ndarray) -> np.ndarray:
+    """Returns whether each column has a peak which is negative, lower than
+    `MIN_PEAK_FRACTION` of the highest peak, narrower than half the spacing of
+    `x`, or outside the range of `x`. Such peaks fit noise, or the residual of
+    the other peaks, rather than modes. See `__peaks_model` for `params`.
+    """
+
+    spacing = np.ptp(x) / max(len(x) - 1, 1)
+    highest = params[..., 2].max(axis=1, initial=0, keepdims=True)
+
+    return np.any(
+        (params[..., 2] <= 0) | (params[..., 2] < MIN_PEAK_FRACTION * highest)
+        | (np.abs(params[..., 1]) < spacing / 2)
+        | (params[..., 0] < x.min()) | (params[..., 0] > x.max()),
+        axis=1
+    )
+
+
+def fit_peak_columns(
+    x: np.ndarray,
+    columns: dict[str, np.ndarray],
+    max_peaks: int = 2,
+    criterion: str = "bic"
+) -> pd.DataFrame:
+    """Fits columns of amplitudes to sums of 1 to `max_peaks` `cauchy` peaks,
+    all columns at once, and chooses the number of peaks of each column by an
+    information criterion. A number of peaks is
+    only chosen if none of its peaks is negative, lower than
+    `MIN_PEAK_FRACTION` of the highest, narrower than half the spacing of `x`,
+    or outside the range of `x`.
+
+    Each number of peaks is fitted from two starts, and the better fit of each
+    column is kept: the fit with one fewer peak, with a new peak guessed from
+    the largest residual, and the largest separate maxima of the data (see
+    `__guess_peaks`). The second start finds modes which the first misses
+    when the fit with one fewer peak lies between them.
+
+    Args:
+        x (numpy.ndarray): The values of f_RF.
+        columns (dict[str, numpy.ndarray]): An ordered dict of the name of
+          each column and its amplitudes at each value of `x`.
+        max_peaks (int): The greatest number of peaks to fit.
+        criterion (str): The information criterion. Acceptable values:
+          "bic" (Bayesian), "aicc" (Akaike, corrected for small samples),
+          which admits weaker peaks.
+
+    Returns:
+        pandas.DataFrame: The number of peaks of each column, and the fitting
+          parameters of each peak, in order of x_0, with their standard
+          deviations. Parameters of peaks beyond the number of peaks are NaN.
+          See `fit_peaks`.
+    """
+
+    if criterion not in CRITERIA:
+        raise ValueError(f"'{criterion}' is not a valid criterion. Use one of {CRITERIA}.")
+
+    x = np.asarray(x, dtype=float)
+    y = np.array([np.asarray(i, dtype=float) for i in columns.values()]).reshape(len(columns), -1)
+    n_points = len(x)
+
+    # Scales x and y to the order of 1.
+    x_shift, x_scale = x.mean() if n_points else 0, np.ptp(x) if n_points > 1 else 1
+    y_scale = np.nanmax(np.abs(y), axis=1, initial=0)
+    y_scale = np.where(y_scale > 0, y_scale, 1)[:, np.newaxis]
+    xs, ys = (x - x_shift) / x_scale, y / y_scale
+
+    valid = np.all(np.isfinite(ys), axis=1)
+    ys = np.where(valid[:, np.newaxis], ys, 0)
+
+    fits = []
+    params = np.empty((len(ys), 0, 3))
+
+    for n_peaks in range(1, max_peaks + 1):
+
+        residual = ys - __peaks_model(xs, params)[0]
+        params = np.concatenate((params, __guess_peak(xs, residual)[:, np.newaxis]), axis=1)
+        params, cost, jac = __batched_lm(xs, ys, params)
+
+        # Rows with fewer separate maxima than peaks keep the first start.
+        guessed = np.empty(0, dtype=int)
+        if n_peaks > 1:
+            guesses = __guess_peaks(xs, ys, n_peaks)
+            guessed = np.flatnonzero(np.all(np.isfinite(guesses), axis=(1, 2)))
+
+        if guessed.size > 0:
+
+            other = __batched_lm(xs, ys[guessed], guesses[guessed])
+
+            with np.errstate(invalid='ignore'):
+                better = np.where(__spurious(xs, other[0]), np.inf, other[1]) \
+                    < np.where(__spurious(xs, params[guessed]), np.inf, cost[guessed])
+
+            for fitted, fitted_other in zip((params, cost, jac), other):
+                fitted[guessed[better]] = fitted_other[better]
+
+        n_params = 3 * n_peaks
+        dof = n_points - n_params
+
+        if criterion == "bic":
+            penalty = n_params * np.log(n_points)
+        else:
+            penalty = 2 * n_params \
+                + (2 * n_params * (n_params + 1) / (dof - 1) if dof > 1 else np.inf)
+
+        variance = cost / dof if dof > 0 else np.full_like(cost, np.inf)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            score = n_points * np.log(cost / n_points + 1e-300) + penalty
+            cov = np.linalg.pinv(np.einsum('cmi,cmj->cij', jac, jac)) \
+                * variance[:, np.newaxis, np.newaxis]
+
+        score = np.where((__spurious(xs, params) | (dof <= 0)) & (n_peaks > 1), np.inf, score)
+
+        sigma = np.sqrt(np.abs(np.diagonal(cov, axis1=1, axis2=2))).reshape(params.shape)
+        fits.append((params, sigma, score))
+
+    best = np.argmin(np.array([score for _, _, score in fits]), axis=0)
+    rows = []
+
+    for i, name in enumerate(columns):
+
+        params, sigma, _ = fits[best[i]]
+        n_peaks = best[i] + 1 if valid[i] else 0
+
+        # Unscales the parameters, with peaks in order of x_0.
+        unscale = np.array([x_scale, x_scale, y_scale[i, 0]])
+        peaks = params[i] * unscale + np.array([x_shift, 0, 0])
+        peaks[:, 1] = np.abs(peaks[:, 1])
+        errors = sigma[i] * unscale
+        order = np.argsort(peaks[:, 0])
+
+        padding = np.full((max_peaks - n_peaks, 3), np.nan)
+        peaks = np.concatenate((peaks[order][:n_peaks], padding))
+        errors = np.concatenate((errors[order][:n_peaks], padding))
+
+        rows.append([name, n_peaks, *peaks.ravel(), *errors.ravel()])
+
+    names = [f"{param}_{i}" for i in range(1, max_peaks + 1) for param in ("x_0", "gamma", "I")]
+
+    return pd.DataFrame(rows, columns=["phi", "peaks", *names, *[f"sigma_{i}" for i in names]])
+
+
+def bootstrap_columns(
+    x: np.ndarray,
+    columns: dict[str, np.ndarray],
+    fitted: pd.DataFrame,
+    resamples: int = 1000,
+    level: float = 0.95,
+    seed: int = 0,
+    start: int = 0
+) -> pd.DataFrame:
+    """Calculates residual-bootstrap confidence intervals of the fits of
+    columns of amplitudes to `cauchy`.
+
+    The residuals of each fit are centred, scaled by sqrt(n / (n - 3)) for the
+    3 fitted parameters, resampled with replacement, and added back to the
+    fitted curve `resamples` times. All resamples of a column are refitted at
+    once by Levenberg-Marquardt, starting from the fit, and the intervals are
+    percentiles of the refitted parameters.
+
+    Args:
+        x (numpy.ndarray): The values of f_RF.
+        columns (dict[str, numpy.ndarray]): See `fit_columns`.
+        fitted (pandas.DataFrame): The fits of `columns`, in order, as
+          returned by `fit_columns`.
+        resamples (int): The number of resamples of each column.
+        level (float): The confidence level of the intervals.
+        seed (int): The seed of the random resampling. Each column is
+          resampled by its own generator, seeded with `seed` and its index, so
+          that results do not depend on how columns are divided among
+          processes.
+        start (int): The index of the first column, for seeding.
+
+    Returns:
+        pandas.DataFrame: The lower and upper bounds of the confidence
+          interval of each fitting parameter. They are NaN for columns whose
+          fit failed.
+    """
+
+    x = np.asarray(x, dtype=float)
+    n_points = len(x)
+    x_shift, x_scale = (x.mean(), np.ptp(x)) if n_points > 1 else (0, 1)
+    rows = []
+
+    for i, y in enumerate(columns.values()):
+
+        popt = fitted[["x_0", "gamma", "I"]].iloc[i].to_numpy(dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        if n_points <= 3 or not (np.all(np.isfinite(popt)) and np.all(np.isfinite(y))):
+            rows.append([np.nan] * 6)
+            continue
+
+        y_fit = cauchy(x, *popt)
+        residual = (y - y_fit - np.mean(y - y_fit)) * np.sqrt(n_points / (n_points - 3))
+
+        rng = np.random.default_rng((seed, start + i))
+        samples = y_fit + residual[rng.integers(n_points, size=(resamples, n_points))]
+
+        # Refits in units of the order of 1. See `__batched_lm`.
+        unscale = np.array([x_scale, x_scale, np.max(np.abs(y_fit)) or 1])
+        shift = np.array([x_shift, 0, 0])
+
+        params, cost, _ = __batched_lm(
+            (x - x_shift) / x_scale,
+            samples / unscale[2],
+            np.tile((popt - shift) / unscale, (resamples, 1, 1))
+        )
+
+        params = params[:, 0] * unscale + shift
+        params[:, 1] = np.abs(params[:, 1])
+        params[~np.isfinite(cost)] = np.nan
+
+        bounds = np.nanquantile(params, [(1 - level) / 2, (1 + level) / 2], axis=0)
+        rows.append(list(bounds.T.ravel()))
+
+    return pd.DataFrame(rows, columns=[
+        f"ci_{bound}_{param}" for param in ("x_0", "gamma", "I") for bound in ("low", "high")])
+
+
+def __read_amp(mag_var: str, xlim: tuple[float], date: str) -> tuple[np.ndarray, dict]:
+    """Reads the amplitudes within `xlim`, as the values of f_RF and an ordered
+    dict of the amplitudes for each value of phi.
+    """
+
+    amp_data = read.read_data(paths.calcvals.amp_path(mag_var, date))
+    extracted_data = amp_data.loc[
+        (amp_data["f_RF"] <= xlim[1]) & (amp_data["f_RF"] >= xlim[0])]       #pylint: disable=E1136
+    amp_cols = list(amp_data.columns)                                    #pylint: disable=no-member
+    amp_cols.remove("f_RF")
+
+    return (
+        extracted_data["f_RF"].to_numpy(),
+        {phi: extracted_data[phi].to_numpy() for phi in amp_cols}
+    )
+
+
+def __fit_chunk(
+    x: np.ndarray,
+    columns: dict[str, np.ndarray],
+    p0: list[float],                                                  #pylint: disable=invalid-name
+    bootstrap: dict = None
+) -> tuple[pd.DataFrame, dict[str, str]]:
+    """Fits a chunk of columns, capturing failures. See `fit_columns`.
+
+    If `bootstrap` is given, confidence intervals are added to the fits, with
+    `bootstrap` as keyword arguments of `bootstrap_columns`.
+    """
+
+    failures = {}
+    fitted = fit_columns(x, columns, p0, failures)
+
+    if bootstrap is not None:
+        fitted = pd.concat([fitted, bootstrap_columns(x, columns, fitted, **bootstrap)], axis=1)
+
+    return fitted, failures
+
+
 def fit_cauchy(
     mag_var: str,
     xlim: tuple[float],
     p0: tuple[float] = None,                                          #pylint: disable=invalid-name
+    resamples: int = 0,
+    level: float = 0.95,
+    seed: int = 0,
     date: str = None
 ):
     """Curve-fits magnetization amplitudes to a Cauchy distribution.
 
+    The columns of phi are fitted in order, each warm-started from the last,
+    with the analytic Jacobian `cauchy_jac`. See `fit_columns`.
+
+    The standard deviations of the fitting parameters are from the diagonal
+    of their covariance, which is unreliable for peaks near the limits of
+    `xlim`. If `resamples` is given, confidence intervals from a residual
+    bootstrap are also written. See `bootstrap_columns`.
+
     Args:
         mag_var (str): The magnetization vector variable to calculate.
           Acceptable values: "mx", "my", "mz".
@@ -35,39 +608,139 @@ def fit_cauchy(
           lower limit and the first value is the upper limit, for reading
           amplitude data.
         p0 (tuple[float]): Initial guesses of fitting parameters for the Cauchy
-          distribution: (x_0, gamma, I).
+          distribution: (x_0, gamma, I). If not given, they are guessed from
+          the data with `cauchy_guess`.
+        resamples (int): The number of bootstrap resamples of each value of
+          phi. If 0, confidence intervals are not calculated.
+        level (float): The confidence level of the intervals.
+        seed (int): The seed of the bootstrap resampling.
     """
 
-    p0 = p0 if p0 is not None else [4.5e9, 0.5e9, 0.004]             # Values are tuned for amp_mz.
     date = date if date is not None else paths.top.latest_date()
 
-    amp_data = read.read_data(paths.calcvals.amp_path(mag_var, date))
-    extracted_data = amp_data.loc[
-        (amp_data["f_RF"] <= xlim[1]) & (amp_data["f_RF"] >= xlim[0])]       #pylint: disable=E1136
-    amp_cols = list(amp_data.columns)                                    #pylint: disable=no-member
-    amp_cols.remove("f_RF")
+    x, columns = __read_amp(mag_var, xlim, date)
+    fitted = fit_columns(x, columns, list(p0) if p0 is not None else None)
+
+    if resamples:
+        fitted = pd.concat(
+            [fitted, bootstrap_columns(x, columns, fitted, resamples, level, seed)], axis=1)
+
+    fitted.to_csv(
+        paths.calcvals.fitted_amp_path(mag_var, date),
+        sep='\t',
+        index=False
+    )
+
+
+def fit_cauchy_batch(
+    dates: list[str],
+    mag_vars: list[str],
+    xlim: tuple[float],
+    p0: tuple[float] = None,                                          #pylint: disable=invalid-name
+    workers: int = 1,
+    resamples: int = 0,
+    level: float = 0.95,
+    seed: int = 0
+) -> list[tuple[str, str, str, str]]:
+    """Curve-fits magnetization amplitudes to a Cauchy distribution, as
+    `fit_cauchy`, for each pair of date and magnetization component.
+
+    The columns of phi of each pair are divided into contiguous chunks of
+    `CHUNK_COLUMNS`, which are fitted on a pool of processes if `workers` is
+    more than 1. Columns are warm-started within each chunk, and the first
+    column of each chunk starts as in `fit_columns`, so the fits are the same
+    for any number of workers. Results are written in order regardless of the
+    order in which chunks finish.
+
+    A column whose fit fails does not stop the others: its parameters are
+    written as NaN, and it is returned as a failure.
 
-    col_num = len(p0) * 2 + 1
-    results = np.empty(shape=(0, col_num))
-    for phi in amp_cols:
+    Bootstrap confidence intervals, if any, are calculated with the fits of
+    each chunk, and are the same for any number of workers.
 
-        fit = curve_fit(
-            f=cauchy,
-            xdata=extracted_data["f_RF"],
-            ydata=extracted_data[phi],
-            p0=p0
+    Args:
+        dates (list[str]): The dates of the results to fit.
+        mag_vars (list[str]): The magnetization components to fit.
+        workers (int): The number of processes fitting at once.
+        resamples (int): See `fit_cauchy`.
+        level (float): See `fit_cauchy`.
+        seed (int): See `fit_cauchy`.
+
+    Returns:
+        list[tuple[str, str, str, str]]: The date, magnetization component,
+          column, and error message of each fit which failed, in order.
+    """
+
+    p0 = list(p0) if p0 is not None else None
+    jobs = [(date, mag_var) for date in dates for mag_var in mag_vars]
+    chunks = []
+
+    for date, mag_var in jobs:
+
+        x, columns = __read_amp(mag_var, xlim, date)
+        names = list(columns)
+
+        chunks.append([
+            (
+                x,
+                {name: columns[name] for name in names[i : i + CHUNK_COLUMNS]},
+                p0,
+                {"resamples": resamples, "level": level, "seed": seed, "start": i}
+                    if resamples else None
+            )
+            for i in range(0, max(len(names), 1), CHUNK_COLUMNS)
+        ])
+
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [[executor.submit(__fit_chunk, *chunk) for chunk in job] for job in chunks]
+            results = [[future.result() for future in job] for job in futures]
+    else:
+        results = [[__fit_chunk(*chunk) for chunk in job] for job in chunks]
+
+    failed = []
+
+    for (date, mag_var), job in zip(jobs, results):
+
+        pd.concat([fitted for fitted, _ in job], ignore_index=True).to_csv(
+            paths.calcvals.fitted_amp_path(mag_var, date),
+            sep='\t',
+            index=False
         )
 
-        results = np.append(
-            arr=results,
-            values=np.reshape([phi, *fit[0], *np.sqrt(np.diag(fit[1]))], newshape=(1, -1)),
-            axis=0
+        failed.extend(
+            (date, mag_var, name, error)
+            for _, failures in job for name, error in failures.items()
         )
 
-    pd.DataFrame(
-        results, columns=["phi", "x_0", "gamma", "I", "sigma_x_0", "sigma_gamma", "sigma_I"]
-    ).to_csv(
-        paths.calcvals.fitted_amp_path(mag_var, date),
+    return failed
+
+
+def fit_peaks(
+    mag_var: str,
+    xlim: tuple[float],
+    max_peaks: int = 2,
+    criterion: str = "bic",
+    date: str = None
+):
+    """Curve-fits magnetization amplitudes to sums of Cauchy distributions,
+    choosing the number of peaks of each value of phi. See `fit_peak_columns`.
+
+    The fitted values can be plotted with `plot.plot_function`, using
+    `lorentzian_sum` and the parameter columns of every peak.
+
+    Args:
+        mag_var (str): The magnetization vector variable to calculate.
+          Acceptable values: "mx", "my", "mz".
+        xlim (tuple[float]): See `fit_cauchy`.
+        max_peaks (int): The greatest number of peaks to fit.
+        criterion (str): See `fit_peak_columns`.
+    """
+
+    date = date if date is not None else paths.top.latest_date()
+
+    fit_peak_columns(*__read_amp(mag_var, xlim, date), max_peaks, criterion).to_csv(
+        paths.calcvals.fitted_peaks_path(mag_var, date),
         sep='\t',
         index=False
     )
@@ -0,0 +1,148 @@
+"""Caches data read from files in memory, so that data used by several
+analyses in one run is only read from disk once.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# The default maximum size of the data held by `FRAMES`, in bytes.
+DEFAULT_MAX_BYTES = 2**30
+
+
+class FrameCache:
+    """A size-bounded, least-recently-used cache of DataFrames read from files.
+
+    Entries are keyed by the path of the file, the columns that were read,
+    and any other read options, and are only served while the size and
+    modification time of the file are unchanged. A request for some columns
+    is served from an entry holding all of them, in any order, so a file read
+    once in full is not read again for a subset of its columns. When the total
+    size of the cached DataFrames exceeds `max_bytes`, the least recently used
+    entries are evicted.
+
+    Copies of the cached DataFrames are returned, so callers may modify them.
+
+    Attributes:
+        max_bytes (int): The maximum total size of the cached DataFrames.
+        hits (int): The number of reads served from the cache.
+        misses (int): The number of reads that were not in the cache.
+        saved_bytes (int): The total size of the files whose reads were
+          served from the cache, i.e. the disk I/O saved.
+        evictions (int): The number of entries evicted to stay within
+          `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_bytes = 0
+        self.evictions = 0
+
+        self.__entries = OrderedDict()
+        self.__files = {}
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached DataFrames, in bytes."""
+        return self.__size
+
+    def get(
+        self,
+        path: str,
+        columns: list[str] = None,
+        options: tuple = ()
+    ) -> pd.DataFrame | None:
+        """Returns a copy of the cached DataFrame for a file, with `columns` in
+        order, or None if they are not cached or the file has changed since
+        they were cached. If `columns` is not given, all columns are returned.
+        """
+
+        file = (os.path.abspath(path), options)
+        stat = os.stat(path)
+
+        with self.__lock:
+
+            for key in list(self.__files.get(file, ())):
+
+                entry = self.__entries[key]
+
+                if entry[0] != (stat.st_size, stat.st_mtime_ns):
+                    self.__remove(key)
+                    continue
+
+                if columns is None and key[1] is not None \
+                    or columns is not None and not set(columns).issubset(entry[1].columns):
+                    continue
+
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                self.saved_bytes += stat.st_size
+
+                return entry[1][list(columns)] if columns is not None else entry[1].copy()
+
+            self.misses += 1
+            return None
+
+    def put(self, path: str, data: pd.DataFrame, columns: list[str] = None, options: tuple = ()):
+        """Caches a DataFrame read from a file with the given columns and read
+        options. Entries for the same file holding only some of `columns` are
+        replaced. DataFrames larger than `max_bytes` are not cached.
+        """
+
+        file = (os.path.abspath(path), options)
+        key = (file, frozenset(columns) if columns is not None else None)
+        stat = os.stat(path)
+        nbytes = int(data.memory_usage(index=True, deep=True).sum())
+
+        if nbytes > self.max_bytes:
+            return
+
+        with self.__lock:
+
+            for other in list(self.__files.get(file, ())):
+                if key[1] is None or other[1] is not None and key[1].issuperset(other[1]):
+                    self.__remove(other)
+
+            self.__entries[key] = ((stat.st_size, stat.st_mtime_ns), data.copy(), nbytes)
+            self.__files.setdefault(file, set()).add(key)
+            self.__size += nbytes
+
+            while self.__size > self.max_bytes:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries. Statistics are kept."""
+
+        with self.__lock:
+            self.__entries.clear()
+            self.__files.clear()
+            self.__size = 0
+
+    def report(self) -> str:
+        """Returns a summary of the cache statistics."""
+
+        return (
+            f"Read cache: {self.hits} {'hit' if self.hits == 1 else 'hits'},"
+            + f" {self.misses} {'miss' if self.misses == 1 else 'misses'},"
+            + f" {self.saved_bytes / 2**20:.1f} MiB of reads saved,"
+            + f" {self.__size / 2**20:.1f} MiB held in memory."
+        )
+
+    def __remove(self, key):
+
+        self.__size -= self.__entries.pop(key)[2]
+
+        self.__files[key[0]].discard(key)
+        if not self.__files[key[0]]:
+            del self.__files[key[0]]
+
+
+FRAMES = FrameCache()
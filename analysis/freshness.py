@@ -0,0 +1,311 @@
+"""Checks if outputs are up to date with their inputs, so that unchanged
+outputs are not made again.
+
+Each output directory has a sidecar manifest, `MANIFEST_NAME`, which records
+for each output file its input files and the parameters it was made with. An
+output is fresh if it exists, it was made with the same parameters, and none of
+its inputs has changed since, as in make.
+
+An input is unchanged if its size and modification time are the same. Inputs
+are not hashed when they are recorded. The first time only the modification
+time of an input differs, the input counts as changed, and its content hash is
+kept for when the output is recorded again. After that, if only its
+modification time differs, as when a file is rewritten with the same content,
+its content hash is compared instead. Split data files kept in a split
+store (see `paths.data.split_store`) are checked by their store file. Inputs
+are recorded by their path relative to the output directory, so a manifest
+stays valid if the results are moved or checked out elsewhere.
+
+A manifest also tracks which outputs in its directory are made by the current
+run, so that outputs which are no longer made can be removed (see `prune`).
+
+Changes to the code which makes an output are not detected. Set `FORCE` to make
+every output again.
+
+Manifests are local build state and are ignored by git.
+"""
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+from analysis import columnar, paths
+
+MANIFEST_NAME = ".freshness.json"
+
+# Whether every output is treated as out of date.
+FORCE = False
+
+
+class Manifest:
+    """The manifest of an output directory.
+
+    Changes are held in memory until `save` is called, so that many outputs in
+    one directory can be checked and recorded with one read and one write.
+
+    Args:
+        directory (str): The output directory.
+    """
+
+    def __init__(self, directory: str):
+
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.__changed = False
+        self.__made = set()
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.__entries = json.load(file)
+        except (OSError, ValueError):
+            self.__entries = {}
+
+    @staticmethod
+    def __source(path: str) -> str | None:
+        """Returns the file holding the data of an input file, or None if it
+        does not exist.
+        """
+
+        if os.path.isfile(path):
+            return path
+
+        stored = paths.data.split_store(path)
+        if stored is not None and os.path.isfile(stored[0]):
+            return stored[0]
+
+        return None
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def __content_hash(path: str, size: int, mtime_ns: int) -> str:   #pylint: disable=W0613
+        """Returns the SHA-1 hash of a file. Cached by the size and
+        modification time of the file, so that a file shared by many outputs
+        is hashed once.
+        """
+
+        digest = hashlib.sha1()
+
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                digest.update(block)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def __stamp(path: str, content: bool = False) -> dict | None:
+        """Returns the size and modification time of an input file, and its
+        content hash if `content` is set. None if it does not exist.
+        """
+
+        source = Manifest.__source(path)
+        if source is None:
+            return None
+
+        stamp = columnar.source_stamp(source)
+
+        if content:
+            stamp["hash"] = Manifest.__content_hash(source, stamp["size"], stamp["mtime_ns"])
+
+        return stamp
+
+    @staticmethod
+    def __normalize(params: dict) -> dict:
+        """Returns parameters as they are stored in a manifest."""
+        return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+    def __key(self, path: str) -> str:
+        """Returns the key of an input file, its path relative to the output
+        directory.
+        """
+
+        try:
+            return os.path.relpath(path, self.directory)
+        except ValueError:
+            # On another drive.
+            return os.path.abspath(path)
+
+    def is_fresh(self, output: str, inputs: list[str], params: dict = None) -> bool:
+        """Checks if an output is up to date.
+
+        Args:
+            output (str): The path of the output file.
+            inputs (list[str]): The paths of the files it is made from.
+            params (dict): The parameters it is made with. Must be JSON
+              serializable, or convertible with `str`.
+        """
+
+        entry = self.__entries.get(os.path.basename(output))
+        self.__made.add(os.path.basename(output))
+
+        if FORCE or entry is None or entry["inputs"] is None or not os.path.isfile(output):
+            return False
+
+        keys = [self.__key(path) for path in inputs]
+
+        if entry["params"] != self.__normalize(params or {}) \
+            or set(entry["inputs"]) != set(keys):
+            return False
+
+        for path, key in zip(inputs, keys):
+
+            recorded, stamp = entry["inputs"][key], self.__stamp(path)
+
+            if stamp is None or stamp["size"] != recorded["size"]:
+                return False
+
+            if stamp["mtime_ns"] != recorded["mtime_ns"]:
+
+                current = self.__stamp(path, content=True)
+
+                if "hash" not in recorded:
+                    # The content cannot be compared, so the hash is kept for the next record.
+                    entry.setdefault("hashes", {})[key] = current
+                    self.__changed = True
+                    return False
+
+                if current["hash"] != recorded["hash"]:
+                    return False
+
+                # Saves hashing the input again while it is unchanged.
+                recorded["mtime_ns"] = stamp["mtime_ns"]
+                self.__changed = True
+
+        return True
+
+    def record(self, output: str, inputs: list[str] | None, params: dict = None):
+        """Records that an output was made from the current version of its
+        inputs. See `is_fresh`.
+
+        Inputs are recorded by their size and modification time. The content
+        hash of an input is only recorded if it is already known for the same
+        version of the input, from `is_fresh` or the previous record.
+
+        If `inputs` is None, or an input does not exist, the output is recorded
+        as made by this run but never up to date.
+        """
+
+        previous = self.__entries.get(os.path.basename(output)) or {}
+        hashed = {**(previous.get("inputs") or {}), **previous.get("hashes", {})}
+        stamps = {}
+
+        for path in inputs or []:
+
+            key, stamp = self.__key(path), self.__stamp(path)
+            known = hashed.get(key)
+
+            if stamp is not None and known is not None and "hash" in known \
+                and (known["size"], known["mtime_ns"]) == (stamp["size"], stamp["mtime_ns"]):
+                stamp = known
+
+            stamps[key] = stamp
+
+        self.__entries[os.path.basename(output)] = {
+            "inputs": stamps if inputs is not None and None not in stamps.values() else None,
+            "params": self.__normalize(params or {})
+        }
+        self.__made.add(os.path.basename(output))
+        self.__changed = True
+
+    def remove(self, output: str):
+        """Removes an output which is no longer made, and its entry."""
+
+        if os.path.isfile(output):
+            os.remove(output)
+
+        if self.__entries.pop(os.path.basename(output), None) is not None:
+            self.__changed = True
+
+    def prune(self):
+        """Removes the outputs listed in the manifest which were neither checked
+        nor recorded since it was read, as they are no longer made.
+        """
+
+        for name in set(self.__entries) - self.__made:
+
+            output = os.path.join(self.directory, name)
+            if os.path.isfile(output):
+                os.remove(output)
+
+            del self.__entries[name]
+            self.__changed = True
+
+    def save(self):
+        """Writes the manifest if it has changed. An empty manifest is
+        removed.
+        """
+
+        if not self.__changed:
+            return
+
+        if not self.__entries:
+
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+            self.__changed = False
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.__entries, file, indent=1)
+
+        os.replace(temp_path, self.path)
+        self.__changed = False
+
+
+def is_fresh(output: str, inputs: list[str], params: dict = None) -> bool:
+    """Checks if an output is up to date. See `Manifest.is_fresh`."""
+
+    manifest = Manifest(os.path.dirname(output))
+    fresh = manifest.is_fresh(output, inputs, params)
+    manifest.save()
+
+    return fresh
+
+
+def record(output: str, inputs: list[str], params: dict = None):
+    """Records that an output was made from the current version of its inputs.
+    See `Manifest.record`.
+    """
+
+    manifest = Manifest(os.path.dirname(output))
+    manifest.record(output, inputs, params)
+    manifest.save()
+
+
+def remove(output: str):
+    """Removes an output which is no longer made. See `Manifest.remove`."""
+
+    manifest = Manifest(os.path.dirname(output))
+    manifest.remove(output)
+    manifest.save()
+
+
+def prune(root: str, manifests: dict[str, Manifest] = None):
+    """Removes the outputs under `root` which are no longer made, and then any
+    empty directories left. See `Manifest.prune`.
+
+    Args:
+        root (str): The output directory, which is searched recursively for
+          manifests.
+        manifests (dict[str, Manifest]): The manifests used by this run, keyed
+          by their directory. Manifests which are not given are read, so every
+          output they list is removed.
+    """
+
+    manifests = {os.path.normpath(key): val for key, val in (manifests or {}).items()}
+
+    for directory, _, files in os.walk(root, topdown=False):
+
+        directory = os.path.normpath(directory)
+
+        if MANIFEST_NAME in files or directory in manifests:
+            manifest = manifests.get(directory) or Manifest(directory)
+            manifest.prune()
+            manifest.save()
+
+        if directory != os.path.normpath(root) and not os.listdir(directory):
+            os.rmdir(directory)
@@ -15,6 +15,11 @@ def amp_path(mag_var: str, date: str = None) -> str:
     return os.path.join(root(date), f"amp_{mag_var}.tsv")
 
 
+def cutoff_path(mag_var: str, date: str = None) -> str:
+    """Returns the path of the steady-state cutoff data."""
+    return os.path.join(root(date), f"cutoff_{mag_var}.tsv")
+
+
 def maxamp_path(date: str = None) -> str:
     """Returns the path of the MaxAmp data."""
     return os.path.join(root(date), "MaxAmp.tsv")
@@ -23,3 +28,10 @@ def maxamp_path(date: str = None) -> str:
 def fitted_amp_path(mag_var: str, date: str = None) -> str:
     """Returns the path of the curve-fitted amplitude data."""
     return os.path.join(root(date), f"fitted amp_{mag_var}.tsv")
+
+
+def fitted_peaks_path(mag_var: str, date: str = None) -> str:
+    """Returns the path of the curve-fitted amplitude data with several
+    peaks.
+    """
+    return os.path.join(root(date), f"fitted peaks_{mag_var}.tsv")
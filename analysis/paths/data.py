@@ -63,3 +63,47 @@ def data_path(date: str = None, vals: dict[str, str] = None) -> str:
         return os.path.join(dataset_dir(date, vals), "table.tsv")
     else:
         return os.path.join(dataset_dir(date, vals), ", ".join(vals.values()) + ".tsv")
+
+
+def cache_path(path: str) -> str:
+    """Returns the path of the columnar cache of a data file."""
+    return path + ".cols"
+
+
+def store_path(names: list[str], date: str = None) -> str:
+    """Returns the path of the split store of the data split by the requested
+    variables, in order of how the data was split. See `analysis.split`.
+    """
+    return os.path.join(top.result_dir(date), "split", ", ".join(names) + ".cols")
+
+
+def manifest_path(names: list[str], date: str = None) -> str:
+    """Returns the path of the manifest of the data split by the requested
+    variables, which records the progress of incremental splits. See
+    `analysis.split`.
+    """
+    return os.path.join(dataset_dir(date, dict.fromkeys(names)), "manifest.json")
+
+
+def split_store(path: str) -> tuple[str, str] | None:
+    """Returns the split store which holds a split data file, and the key of
+    the split in the store's index.
+
+    The key is the path of the data file relative to its dataset, without the
+    extension and with "/" separators. `path` may also be a directory within a
+    dataset, in which case the key is the prefix of the splits it contains.
+    Returns None if `path` is not within a split dataset.
+    """
+
+    parts = os.path.normpath(path).split(os.sep)
+
+    if "split" not in parts[:-1]:
+        return None
+
+    i = len(parts) - 2 - parts[-2::-1].index("split")
+    key = "/".join(parts[i + 2:])
+
+    return (
+        os.path.join(os.sep.join(parts[:i + 1]), parts[i + 1] + ".cols"),
+        key[:-len(".tsv")] if key.endswith(".tsv") else key
+    )
@@ -2,12 +2,65 @@
 
 import os
 import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
 import numpy as np
 import pandas as pd
 
-from analysis import read, paths, write
+from analysis import freshness, read, paths, write
+
+
+def decimate(
+    x: np.ndarray,
+    ys: np.ndarray,
+    max_points: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Reduces lines to at most `max_points` points each, keeping their shape.
+
+    The points are divided into `max_points` // 2 buckets of consecutive
+    points, and the minimum and maximum of each line in each bucket are kept,
+    in order. Peaks and envelopes therefore look the same at any resolution
+    with fewer pixels than buckets. All lines are decimated at once.
+
+    Args:
+        x (numpy.ndarray): The values of the independent variable, of shape
+          (points,).
+        ys (numpy.ndarray): The values of each line, of shape (lines, points).
+        max_points (int): The greatest number of points of each line.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The values of x and y of each
+          line, each of shape (lines, points). Lines with no more than
+          `max_points` points are returned as they are.
+    """
+
+    x = np.asarray(x)
+    ys = np.atleast_2d(np.asarray(ys))
+    n_points = len(x)
+
+    if n_points <= max_points:
+        return np.broadcast_to(x, ys.shape), ys
+
+    buckets = max(max_points // 2, 1)
+    size = -(-n_points // buckets)
+
+    # Pads the last bucket with its last point, which changes neither extreme.
+    padded = np.pad(ys, ((0, 0), (0, buckets * size - n_points)), mode='edge')
+    padded = padded.reshape((len(ys), buckets, size))
+
+    extremes = np.stack((
+        np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=2),
+        np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=2)
+    ), axis=2)
+
+    index = np.sort(extremes, axis=2) + (np.arange(buckets) * size)[:, np.newaxis]
+    index = np.minimum(index.reshape(len(ys), -1), n_points - 1)
+
+    return x[index], np.take_along_axis(ys, index, axis=1)
 
 
 def plot_xy(
@@ -20,13 +73,15 @@ def plot_xy(
     cmap_name: str = "gist_rainbow",
     title: str = None,
     save_to: str = None,
-    show_plot: bool = False
+    show_plot: bool = False,
+    max_points: int = None
 ):
     """Plots a number of dependent variables against an independent variable.
 
     Args:
         attr_data (list[AttributedData]): A list of data to plot. The item at
-          index 0 will be treated as the primary data.
+          index 0 will be treated as the primary data. A single
+          `AttributedData` is also accepted.
         xlabel (str): The label on the x-axis. If not given, defaults to
           `x-var` of the primary data.
         ylabel (str): The label on the y-axis. If not given, defaults to comma-
@@ -44,17 +99,28 @@ def plot_xy(
           list of compatible formats. If not given, the graph will not be
           saved, and will be shown instead.
         show_plot (bool): Whether to show (`matplotlib.pyplot.show`) the graph.
+        max_points (int): If given, each line is decimated to at most this many
+          points, keeping its shape. See `decimate`.
     """
 
+    if isinstance(attr_data, read.AttributedData):
+        attr_data = [attr_data]
+
     fig = plt.figure(figsize=(7.5, 4.5))
     ax = fig.add_subplot(1, 1, 1)
 
     colors = plt.get_cmap(cmap_name)
     for datum in attr_data:
-        for i, var in enumerate(datum.y_vars):
+
+        lines = [(datum.data[datum.x_var], datum.data[var]) for var in datum.y_vars]
+        if max_points is not None:
+            lines = zip(*decimate(
+                datum.data[datum.x_var], [datum.data[var] for var in datum.y_vars], max_points))
+
+        for i, (var, (x_vals, y_vals)) in enumerate(zip(datum.y_vars, lines)):
             ax.plot(
-                datum.data[datum.x_var],
-                datum.data[var],
+                x_vals,
+                y_vals,
                 datum.fmt,
                 label=var,
                 c=colors(i / len(datum.y_vars))
@@ -80,7 +146,7 @@ def plot_xy(
     if xstep is not None:
         x_vals = attr_data[0].data[attr_data[0].x_var]
 
-        ax.set_xticks(np.arange(min(x_vals), max(x_vals) + xstep, xstep))
+        ax.set_xticks(np.arange(np.min(x_vals), np.max(x_vals) + xstep, xstep))
 
     if save_to is not None:
 
@@ -95,6 +161,268 @@ def plot_xy(
     plt.close()
 
 
+class XYBatch:
+    """Plots many datasets of the same variables, as `plot_xy`, reusing one
+    figure.
+
+    The figure, its lines and its legend are created once. Each plot only
+    replaces the data of the lines, the x-axis ticks, and the limits which are
+    not fixed, which is much faster than creating a figure. If used as a
+    context manager, the figure is closed on exit.
+
+    The figure may hold a grid of several panels, each plotting one dataset,
+    for contact sheets. Only the first panel has a legend.
+
+    Args:
+        x_var (str): The name of the independent variable.
+        y_vars (list[str]): The names of the dependent variables.
+        fmt (str): The format string of the lines. See `read.AttributedData`.
+        panels (int): The number of panels in the figure.
+        (See plot_xy docs for other parameters.)
+    """
+
+    def __init__(
+        self,
+        x_var: str,
+        y_vars: list[str],
+        fmt: str = '-',
+        xlabel: str = None,
+        ylabel: str = None,
+        xlim: list[float, float] = None,
+        ylim: list[float, float] = None,
+        xstep: float = None,
+        cmap_name: str = "gist_rainbow",
+        title: str = None,
+        max_points: int = None,
+        panels: int = 1
+    ):
+
+        self.x_var = x_var
+        self.y_vars = list(y_vars)
+        self.xstep = xstep
+        self.max_points = max_points
+
+        n_cols = int(np.ceil(np.sqrt(panels)))
+        n_rows = -(-panels // n_cols)
+
+        self.__fig = plt.figure(
+            figsize=(7.5, 4.5) if panels == 1 else (3.75 * n_cols, 2.5 * n_rows),
+            layout=None if panels == 1 else "constrained"
+        )
+        self.__axes = [self.__fig.add_subplot(n_rows, n_cols, i + 1) for i in range(panels)]
+
+        colors = plt.get_cmap(cmap_name)
+        self.__lines = [
+            [
+                ax.plot([], [], fmt, label=var, c=colors(i / len(self.y_vars)))[0]
+                for i, var in enumerate(self.y_vars)
+            ]
+            for ax in self.__axes
+        ]
+
+        xlabel = xlabel if xlabel is not None else x_var
+        ylabel = ylabel if ylabel is not None else ', '.join(self.y_vars)
+        self.__title = title if title is not None else f"{ylabel} against {xlabel}"
+
+        for ax in self.__axes:
+
+            ax.set_xlabel(xlabel)
+            ax.set_ylabel(ylabel)
+            ax.set_title(self.__title)
+
+            # Fixed limits also stop autoscaling on that axis.
+            if xlim is not None:
+                ax.set_xlim(xlim)
+            if ylim is not None:
+                ax.set_ylim(ylim)
+
+        if len(self.y_vars) > 15:
+            self.__axes[0].legend(ncol=5, fontsize='xx-small')
+        elif len(self.y_vars) > 1:
+            self.__axes[0].legend()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def panels(self) -> int:
+        """The number of panels in the figure."""
+        return len(self.__axes)
+
+    def draw(self, data: pd.DataFrame, panel: int = 0, title: str = None):
+        """Plots data on a panel, without saving the figure.
+
+        Args:
+            data (pandas.DataFrame): The data.
+            panel (int): The index of the panel. The panel is shown if it was
+              hidden by `hide_panels`.
+            title (str): The title of the panel. If not given, the title of
+              the batch is used.
+        """
+
+        ax = self.__axes[panel]
+
+        x_vals = np.asarray(data[self.x_var])
+        lines = [(x_vals, np.asarray(data[var])) for var in self.y_vars]
+
+        if self.max_points is not None:
+            lines = zip(*decimate(x_vals, [data[var] for var in self.y_vars], self.max_points))
+
+        for line, (line_x, line_y) in zip(self.__lines[panel], lines):
+            line.set_data(line_x, line_y)
+
+        ax.relim()
+        ax.autoscale_view()
+
+        if self.xstep is not None:
+            ax.set_xticks(np.arange(np.min(x_vals), np.max(x_vals) + self.xstep, self.xstep))
+
+        ax.set_title(title if title is not None else self.__title)
+
+        ax.set_visible(True)
+
+    def hide_panels(self, start: int):
+        """Hides the panels from index `start` onwards, such as the unused
+        panels of the last contact sheet.
+        """
+        for ax in self.__axes[start:]:
+            ax.set_visible(False)
+
+    def save(self, save_to):
+        """Saves the figure.
+
+        Args:
+            save_to: The full path to which the figure is saved, with the
+              format given by the extension, or an open
+              `matplotlib.backends.backend_pdf.PdfPages`, to which the figure
+              is added as a page.
+        """
+
+        if isinstance(save_to, PdfPages):
+            save_to.savefig(self.__fig)
+            return
+
+        write.prep_dir(os.path.split(save_to)[0], clear=False)
+
+        _, save_type = os.path.splitext(save_to)
+        self.__fig.savefig(save_to, format=save_type.strip('.'))
+
+    def plot(self, data: pd.DataFrame, save_to: str):
+        """Plots data and saves the graph to `save_to`. See `plot_xy`."""
+        self.draw(data)
+        self.save(save_to)
+
+    def close(self):
+        """Closes the figure."""
+        plt.close(self.__fig)
+
+
+# The figure reused by a render process. See `plot_dataset_xy`.
+__RENDER_BATCH = None
+
+
+def __init_render_worker(batch_kwargs: dict):
+    """Initializes a render process with a non-interactive backend, so that
+    figures are never shown, and the figure it reuses.
+    """
+
+    global __RENDER_BATCH                                             #pylint: disable=W0603
+
+    matplotlib.use("Agg")
+    __RENDER_BATCH = XYBatch(**batch_kwargs)
+
+
+def __render_xy(datum: read.AttributedData, save_to: str):
+    """Renders and saves a plot in a render process. See `XYBatch.plot`."""
+    __RENDER_BATCH.plot(datum.data, save_to)
+
+
+def __dataset_plot_path(save_to_root: str, title: str, plot_format: str) -> str:
+    """Returns the path to which a plot of a dataset item is saved, creating
+    its directory.
+    """
+
+    split_keys = title.split(", ")
+
+    if len(split_keys) > 1:
+        write.prep_dir(os.path.join(save_to_root, *split_keys[:-1]), clear=False)
+
+    return os.path.join(save_to_root, *split_keys[:-1], title + '.' + plot_format)
+
+
+def __plot_dataset_pages(
+    attr_data: list[read.AttributedData],
+    batch_kwargs: dict,
+    save_to_root: str,
+    output: str,
+    panels: int,
+    read_workers: int,
+    read_pool: str,
+    manifest: freshness.Manifest
+) -> int:
+    """Plots a dataset into one multi-page PDF, or into PNG contact sheets of
+    `panels` plots each, recording them in `manifest`. See `plot_dataset_xy`.
+    """
+
+    name = os.path.basename(os.path.normpath(save_to_root))
+    panels = panels if output == "sheet" else 1
+
+    if output == "pdf":
+        groups = {os.path.join(save_to_root, f"{name}.pdf"): attr_data}
+    else:
+        groups = {
+            os.path.join(save_to_root, f"{name} {i // panels + 1:03d}.png"):
+                attr_data[i : i + panels]
+            for i in range(0, len(attr_data), panels)
+        }
+
+    params = {**batch_kwargs, "panels": panels}
+    stale = []
+
+    # Skips pages which are up to date with their data files.
+    for save_to, group in groups.items():
+        inputs = [datum.path for datum in group]
+        inputs = inputs if None not in inputs else None
+        if inputs is None or not manifest.is_fresh(save_to, inputs, params):
+            stale.append((save_to, group, inputs))
+
+    stream = read.stream_dataset(
+        [datum for _, group, _ in stale for datum in group], read_workers, read_pool)
+    title = batch_kwargs["title"]
+
+    with XYBatch(**batch_kwargs, panels=panels) as batch:
+        for save_to, group, inputs in stale:
+
+            if output == "pdf":
+
+                # Pages are written as they are plotted, and resources such as
+                # fonts are shared between them.
+                temp_path = f"{save_to}.{os.getpid()}.tmp"
+
+                with PdfPages(temp_path) as pages:
+                    for _, datum in zip(group, stream):
+                        batch.draw(datum.data, title=datum.title if title is None
+                            else f"{title} ({datum.title})")
+                        batch.save(pages)
+
+                os.replace(temp_path, save_to)
+
+            else:
+
+                for panel, datum in zip(range(len(group)), stream):
+                    batch.draw(datum.data, panel, title=datum.title)
+
+                batch.hide_panels(len(group))
+                batch.save(save_to)
+
+            manifest.record(save_to, inputs, params)
+
+    return sum(len(group) for _, group, _ in stale)
+
+
 def plot_dataset_xy(
     attr_data: list[read.AttributedData],
     x_var: str,
@@ -106,10 +434,38 @@ def plot_dataset_xy(
     xstep: float = None,
     title: str = None,
     save_to_root: str = None,
-    plot_format: str = "pdf"
-):
+    plot_format: str = "pdf",
+    read_workers: int = 1,
+    read_pool: str = "thread",
+    render_workers: int = 1,
+    max_points: int = None,
+    output: str = "files",
+    sheet_panels: int = 16
+) -> int:
     """Plots a dataset into multiple plots.
 
+    The dataset is streamed (see `analysis.read.stream_dataset`), so if it
+    was read lazily, only a few data files are held in memory at a time. All
+    plots are drawn on one reused figure (see `XYBatch`).
+
+    Plots which are up to date with their data files and parameters are not
+    drawn again, and the output directory is only cleared if `freshness.FORCE`
+    is set. Plots left in it by earlier runs which are no longer made, such as
+    those of splits which no longer exist or of another `output`, are removed.
+    See `analysis.freshness`.
+
+    Instead of a file per plot, the plots may be written as the pages of one
+    PDF, or as PNG contact sheets of several plots each, named after
+    `save_to_root` inside it. Pages are written as they are drawn, so only a
+    page is held in memory, and each page is titled with the title of its
+    data. `render_workers` is not used.
+
+    If `render_workers` is more than 1, plots are rendered on a pool of
+    processes with the non-interactive "Agg" backend instead. Lazy data files
+    are then read by the process rendering them, and `read_workers` is not
+    used. Each process reuses its own figure. At most 2 plots per process are
+    pending at a time.
+
     Args:
         data (list[analysis.read.AttributedData]): A list of data generated by
           `analysis.read.read_dataset`. See `read_dataset` docs for details.
@@ -118,26 +474,96 @@ def plot_dataset_xy(
           in `paths`.
         plot_format (str): The format of the resultant graph. See matplotlib
           docs for a list of compatible formats.
+        read_workers (int): The number of lazy data files to read ahead of
+          plotting. See `stream_dataset`.
+        read_pool (str): The type of worker pool used to read ahead. See
+          `stream_dataset`.
+        render_workers (int): The number of processes rendering plots.
+        max_points (int): See `plot_xy`.
+        output (str): How plots are written. Acceptable values: "files" (a
+          file per plot, in `plot_format`), "pdf" (one multi-page PDF),
+          "sheet" (PNG contact sheets).
+        sheet_panels (int): The number of plots on each contact sheet.
         (See plot_xy docs for other parameters.)
+
+    Returns:
+        int: The number of plots drawn.
     """
 
-    write.prep_dir(save_to_root)
+    if output not in ("files", "pdf", "sheet"):
+        raise ValueError(f"'{output}' is not a valid output. Use 'files', 'pdf', or 'sheet'.")
+
+    write.prep_dir(save_to_root, clear=freshness.FORCE)
+
+    batch_kwargs = {"x_var": x_var, "y_vars": y_vars, "xlabel": xlabel, "ylabel": ylabel,
+        "xlim": xlim, "ylim": ylim, "xstep": xstep, "title": title, "max_points": max_points}
+
+    manifests = {}
+
+    if output != "files":
+        manifests[save_to_root] = freshness.Manifest(save_to_root)
+        count = __plot_dataset_pages(attr_data, batch_kwargs, save_to_root, output,
+            sheet_panels, read_workers, read_pool, manifests[save_to_root])
+        freshness.prune(save_to_root, manifests)
+        return count
 
+    stale = []
+
+    # Skips plots which are up to date with their data files.
     for datum in attr_data:
 
-        save_to = save_to_root
-        split_keys = datum.title.split(", ")
+        save_to = __dataset_plot_path(save_to_root, datum.title, plot_format)
+        inputs = [datum.path] if datum.path is not None else None
+
+        manifest = manifests.get(os.path.dirname(save_to))
+        if manifest is None:
+            manifest = manifests[os.path.dirname(save_to)] = freshness.Manifest(
+                os.path.dirname(save_to))
+
+        if inputs is None or not manifest.is_fresh(save_to, inputs, batch_kwargs):
+            stale.append((datum, save_to, inputs, manifest))
+
+    if render_workers <= 1:
+
+        with XYBatch(**batch_kwargs) as batch:
+            for datum, (_, save_to, _, _) in zip(
+                read.stream_dataset([i[0] for i in stale], read_workers, read_pool), stale):
+                batch.plot(datum.data, save_to)
+
+    else:
+
+        with ProcessPoolExecutor(
+            render_workers,
+            initializer=__init_render_worker,
+            initargs=(batch_kwargs,)
+        ) as executor:
+
+            pending = deque()
+
+            for datum, save_to, _, _ in stale:
+
+                # Lazy data files are left for the render process to read.
+                job = read.AttributedData(
+                    datum.data if datum.path is None or datum.loaded else None,
+                    path=datum.path,
+                    columns=datum.columns,
+                    float32=datum.float32
+                )
+
+                pending.append(executor.submit(__render_xy, job, save_to))
+
+                if len(pending) >= 2 * render_workers:
+                    pending.popleft().result()
+
+            while pending:
+                pending.popleft().result()
 
-        if len(split_keys) == 1:
-            save_to = os.path.join(save_to, datum.title + '.' + plot_format)
+    for _, save_to, inputs, manifest in stale:
+        manifest.record(save_to, inputs, batch_kwargs)
 
-        elif len(split_keys) > 1:
-            write.prep_dir(os.path.join(save_to_root, *split_keys[:-1]), clear=False)
-            save_to = os.path.join(save_to, *split_keys[:-1], datum.title + '.' + plot_format)
+    freshness.prune(save_to_root, manifests)
 
-        plot_xy(read.AttributedData(datum.data, x_var=x_var, y_vars=y_vars),
-            xlabel=xlabel, ylabel=ylabel, xlim=xlim, ylim=ylim, xstep=xstep, title=title,
-            save_to=save_to)
+    return len(stale)
 
 
 def plot_function(
@@ -368,7 +794,7 @@ def spectrum_anl(
     """
 
     fmax = (1/dt) / 2
-    table = read.read_data(paths.data.data_path(date))
+    table = read.read_data(paths.data.data_path(date), [component])
 
     dm = table[component] - table[component][0]                             #pylint: disable=C0103
     spectr = np.abs(np.fft.fft(dm))
@@ -402,7 +828,7 @@ def spectrum_anl_check(
 ):
     """Plots the spectrum analysis with dotted lines corrresponding to resonant frequencies"""
 
-    table = read.read_data(paths.data.data_path(date))
+    table = read.read_data(paths.data.data_path(date), [component])
     fmax = (1/dt) / 2
 
     dm     = table[component] - table[component][0]                          #pylint: disable=C0103
@@ -1,12 +1,41 @@
 """Finds and reads data and datasets from results."""
 
 import os
+import warnings
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO, StringIO
+from itertools import repeat
 from re import sub
 
+import numpy as np
 import pandas as pd
 
-from analysis import paths
+from analysis import columnar, framecache, paths
+
+try:
+    import pyarrow
+    from pyarrow import csv as pyarrow_csv
+except ImportError:
+    pyarrow, pyarrow_csv = None, None
+
+# The environment variable which selects the parser used by `read_data`. See `csv_engine`.
+CSV_ENGINE_ENV = "ANALYSIS_CSV_ENGINE"
+
+# The least size, in bytes, of a data file for which `read_data` builds a columnar cache. Smaller
+# files, such as split data files and calculated values, parse quickly and are not cached.
+CACHE_MIN_SIZE = 2**24
+
+# The default number of rows in each chunk yielded by `read_chunks`.
+CHUNK_ROWS = 2**18
+
+# The approximate peak memory used for each value in a chunk, as a multiple of
+# the 8 bytes of its float64 representation. Covers parser buffers and the
+# copies made when a chunk is split.
+CHUNK_OVERHEAD = 4
 
 
 @dataclass
@@ -16,8 +45,13 @@ class AttributedData:
     Plotting properties (for `analysis.plot` methods) are also included, but
     not required.
 
+    The data may be loaded lazily: if `data` is not given but `path` is, the
+    data file is read when `data` is first accessed, and can be dropped from
+    memory with `release` once it is no longer needed.
+
     Attributes:
-        data (pandas.DataFrame): The data.
+        data (pandas.DataFrame): The data. Column mappings returned by
+          `map_data` may also be used.
         title (str): The title of the data.
         x_var (str): The name of the independent variable (on the x-axis).
           Should correspond to a variable in the data file.
@@ -25,6 +59,10 @@ class AttributedData:
           y-axis). Should correspond to a variable in the data file.
         fmt (str): The format string for the plot. See matplotlib docs for
           syntax. Defaults to solid line of default color.
+        path (str): The path of the data file from which `data` is loaded
+          lazily.
+        columns (list[str]): The columns to load from `path`. See `read_data`.
+        float32 (bool): Whether to load `path` as float32. See `read_data`.
     """
 
     # Data properties
@@ -36,55 +74,671 @@ class AttributedData:
     y_vars: list[str] = None
     fmt: str = '-'
 
+    # Lazy loading properties
+    path: str = None
+    columns: list[str] = None
+    float32: bool = False
+
+    _data = None
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """The data, read from `path` on first access if it was not given."""
+
+        if self._data is None and self.path is not None:
+            self._data = read_data(self.path, self.columns, self.float32)
+
+        return self._data
+
+    @data.setter
+    def data(self, value: pd.DataFrame):
+
+        # Without an argument, the dataclass passes the property itself as the default.
+        self._data = value if not isinstance(value, property) else None
 
-def read_data(path: str) -> pd.DataFrame:
-    """Reads a data file into a Pandas DataFrame."""
+    @property
+    def loaded(self) -> bool:
+        """Whether the data is currently held in memory."""
+        return self._data is not None
+
+    def release(self):
+        """Drops the data from memory if it can be loaded again from `path`."""
+
+        if self.path is not None:
+            self._data = None
+
+
+def __parse_names(header: str) -> list[str]:
+    """Parses the variable names from the header line of a data file."""
+
+    names = header.strip('#').split('\t')
+    names = [sub(r"[\(].*?[\)]", "", i) for i in names]        # Removes units in brackets.
+    names = [i.strip() for i in names]
+
+    return names
+
+
+def __read_names(path: str) -> list[str]:
+    """Reads the variable names from the header of a data file."""
 
     with open(path, 'r', encoding="utf-8") as file:
+        return __parse_names(file.readline())
+
 
-        names = file.readline().strip('#').split('\t')
-        names = [sub(r"[\(].*?[\)]", "", i) for i in names]    # Removes units in brackets.
-        names = [i.strip() for i in names]
+def __chunk_rows(n_cols: int, max_memory: int = None) -> int:
+    """Returns the number of rows in a chunk of a table with `n_cols` columns,
+    such that the chunk uses about `max_memory` bytes.
+    """
 
-        return pd.read_csv(path, sep='\t', skiprows=1, names=names)
+    if max_memory is None:
+        return CHUNK_ROWS
+    else:
+        return max(1, max_memory // (n_cols * 8 * CHUNK_OVERHEAD))
 
 
-def read_dataset(path: str) -> list[pd.DataFrame]:
-    """Reads a dataset into a list of `AttributedData`."""
+def csv_engine(engine: str = None) -> str:
+    """Resolves the parser used to read data files.
 
-    dataset_data = []
+    Args:
+        engine (str): "c" for the pandas C parser, "pyarrow" for the
+          multithreaded pyarrow CSV reader, or "auto" for pyarrow if it is
+          installed. If not given, the `CSV_ENGINE_ENV` environment variable
+          is used, defaulting to "c". pyarrow falls back to the C parser if it
+          is not installed.
 
-    for root, _, files in os.walk(path):
-        for file in files:
-            name, ext = os.path.splitext(file)
-            #TODO: raise FileNotFound error
-            if ext.endswith("tsv"):
-                dataset_data.append(
-                    AttributedData(
-                        data=read_data(os.path.join(root, file)),
-                        title=name
-                    )
+    Returns:
+        str: "c" or "pyarrow".
+    """
+
+    engine = engine if engine is not None else os.environ.get(CSV_ENGINE_ENV, "c")
+
+    if engine not in ("c", "pyarrow", "auto"):
+        raise ValueError(f"'{engine}' is not a valid engine. Use 'c', 'pyarrow', or 'auto'.")
+
+    if engine == "c" or (engine == "auto" and pyarrow_csv is None):
+        return "c"
+
+    if pyarrow_csv is None:
+        warnings.warn("pyarrow is not installed; falling back to the C parser.")
+        return "c"
+
+    return "pyarrow"
+
+
+def __read_csv(
+    path: str,
+    columns: list[str],
+    float32: bool,
+    engine: str
+) -> pd.DataFrame:
+    """Parses a data file with the given engine. See `read_data`."""
+
+    names = __read_names(path)
+
+    if csv_engine(engine) == "pyarrow":
+
+        return pyarrow_csv.read_csv(
+            path,
+            read_options=pyarrow_csv.ReadOptions(column_names=names, skip_rows=1),
+            parse_options=pyarrow_csv.ParseOptions(delimiter='\t'),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={i: pyarrow.float32() for i in names} if float32 else None
+            )
+        ).to_pandas()
+
+    else:
+
+        data = pd.read_csv(path, sep='\t', skiprows=1, names=names,
+            usecols=columns, dtype=np.float32 if float32 else None)
+
+        return data[columns] if columns is not None and list(data.columns) != columns else data
+
+
+def read_data(
+    path: str,
+    columns: list[str] = None,
+    float32: bool = False,
+    cache: bool = True,
+    engine: str = None
+) -> pd.DataFrame:
+    """Reads a data file into a Pandas DataFrame.
+
+    Data files that were already read in this process are served from
+    `framecache.FRAMES` while they are unchanged. If `path` is a split data
+    file that was written to a split store rather than to its own file (see
+    `analysis.split`), the split is read from the store.
+
+    Args:
+        path (str): The path of the data file.
+        columns (list[str]): The names of the columns to read. Other columns
+          are skipped while parsing. If not given, all columns are read.
+        float32 (bool): Whether to read all columns as float32 instead of
+          their inferred types, halving the memory used by float64 data.
+        cache (bool): Whether to use the in-memory cache and the columnar
+          cache of the data file. If the columnar cache is up to date with the
+          data file, it is read instead of parsing the data file. Otherwise,
+          the data file is parsed and, if all columns were read as their
+          inferred types and the data file has at least `CACHE_MIN_SIZE`
+          bytes, such as a large table, the columnar cache is rebuilt. Only
+          numeric data is cached in columnar form.
+        engine (str): The parser used to read the data file. See
+          `csv_engine`.
+    """
+
+    columns = list(columns) if columns is not None else None
+
+    stored = paths.data.split_store(path) if not os.path.exists(path) else None
+
+    if stored is not None and os.path.isfile(stored[0]):
+        data = pd.DataFrame(__map_split(*stored, columns))
+        return data.astype(np.float32) if float32 else data
+
+    if cache:
+        data = framecache.FRAMES.get(path, columns, (float32,))
+        if data is not None:
+            return data
+
+    cache_path = paths.data.cache_path(path)
+
+    if cache and columnar.is_fresh(cache_path, path):
+
+        data = pd.DataFrame(columnar.read_columns(cache_path, columns))
+
+        if float32:
+            data = data.astype(np.float32)
+
+    else:
+
+        data = __read_csv(path, columns, float32, engine)
+
+        if cache and columns is None and not float32 \
+            and os.path.getsize(path) >= CACHE_MIN_SIZE \
+            and all(pd.api.types.is_numeric_dtype(i) for i in data.dtypes):
+            try:
+                columnar.write_columns(
+                    cache_path,
+                    {name: data[name].to_numpy() for name in data.columns},
+                    source=path
                 )
+            except OSError:
+                pass                        # The cache is optional; the data is still returned.
+
+    if cache:
+        framecache.FRAMES.put(path, data, columns, (float32,))
+
+    return data
+
+
+def widen_dtypes(dtypes: dict[str, np.dtype], chunk: pd.DataFrame) -> dict[str, np.dtype]:
+    """Widens the dtype of each column to also hold the data in a chunk.
+
+    A column which is parsed as integers in one chunk may be parsed as floats
+    in another. Widening the dtypes over every chunk of a data file gives the
+    dtypes inferred when the whole data file is read at once.
+    """
+
+    return {
+        name: np.result_type(dtypes[name], dtype) if name in dtypes else dtype
+        for name, dtype in chunk.dtypes.items()
+    }
+
+
+def read_dtypes(path: str, max_memory: int = None) -> dict[str, np.dtype]:
+    """Returns the dtype of each column of a data file, as inferred when the
+    whole data file is read at once.
+
+    The dtypes are taken from the columnar cache of the data file if it is up
+    to date. Otherwise, the data file is parsed in chunks (see `read_chunks`
+    for `max_memory`).
+    """
+
+    cache_path = paths.data.cache_path(path)
+
+    if columnar.is_fresh(cache_path, path):
+        header = columnar.read_header(cache_path)
+        return {name: np.dtype(dtype) for name, dtype in zip(header["names"], header["dtypes"])}
+
+    dtypes = {}
+    for chunk in read_chunks(path, max_memory=max_memory):
+        dtypes = widen_dtypes(dtypes, chunk)
+
+    return dtypes
+
+
+def read_chunks(
+    path: str,
+    chunk_rows: int = None,
+    max_memory: int = None,
+    dtypes: dict[str, np.dtype] = None
+) -> Iterator[pd.DataFrame]:
+    """Reads a data file as a sequence of DataFrames, each containing a fixed
+    number of consecutive rows.
+
+    The variable names are read from the header once, and shared by all
+    chunks. Only one chunk is held in memory at a time.
+
+    Args:
+        path (str): The path of the data file.
+        chunk_rows (int): The number of rows in each chunk. Defaults to
+          `CHUNK_ROWS`, unless `max_memory` is given.
+        max_memory (int): The approximate peak memory, in bytes, to be used by
+          each chunk. Used to determine the number of rows in each chunk if
+          `chunk_rows` is not given.
+        dtypes (dict[str, numpy.dtype]): The dtype of each column, shared by
+          all chunks. If not given, the dtypes are inferred for each chunk
+          separately, and may differ between chunks. See `read_dtypes`.
+
+    Yields:
+        pandas.DataFrame: The next chunk of rows.
+    """
+
+    names = __read_names(path)
+    chunk_rows = chunk_rows if chunk_rows is not None else __chunk_rows(len(names), max_memory)
+
+    with pd.read_csv(path, sep='\t', skiprows=1, names=names, chunksize=chunk_rows,
+        dtype=dtypes or None) as reader:
+        yield from reader
+
+
+def __parse_lines(
+    lines: list[bytes],
+    names: list[str],
+    dtypes: dict[str, np.dtype] = None
+) -> pd.DataFrame:
+    """Parses lines of a data file, without its header, into a DataFrame."""
+    return pd.read_csv(BytesIO(b"".join(lines)), sep='\t', names=names, dtype=dtypes or None)
+
+
+def read_appended(
+    path: str,
+    offset: int,
+    chunk_rows: int = None,
+    max_memory: int = None,
+    dtypes: dict[str, np.dtype] = None,
+    end: int = None
+) -> Iterator[tuple[pd.DataFrame, int]]:
+    """Reads the rows of a data file which follow a byte offset, as a sequence
+    of DataFrames each containing a fixed number of consecutive rows. See
+    `read_chunks` for `chunk_rows`, `max_memory`, and `dtypes`.
+
+    Only complete lines are read, so that a data file which is still being
+    written can be read again from the last returned offset once more rows
+    are complete.
+
+    Args:
+        offset (int): The byte offset of the first row to be read. Must be at
+          the start of a row after the header.
+        end (int): The byte offset at which to stop reading. Must be at the
+          end of a row, such as an offset returned by an earlier read. If not
+          given, all complete rows are read.
+
+    Yields:
+        tuple[pandas.DataFrame, int]: The next chunk of rows, and the byte
+          offset of the end of its last row.
+    """
+
+    names = __read_names(path)
+    chunk_rows = chunk_rows if chunk_rows is not None else __chunk_rows(len(names), max_memory)
+
+    with open(path, 'rb') as file:
+
+        file.seek(offset)
+        batch = []
+
+        for line in file:
+
+            if not line.endswith(b"\n") or (end is not None and offset >= end):
+                break
+
+            batch.append(line)
+            offset += len(line)
+
+            if len(batch) >= chunk_rows:
+                yield __parse_lines(batch, names, dtypes), offset
+                batch = []
+
+        if batch:
+            yield __parse_lines(batch, names, dtypes), offset
+
+
+def map_data(path: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """Maps a data file into memory as zero-copy, read-only numpy views of
+    each column.
 
-    return dataset_data
+    The data file is converted to the columnar format (see
+    `analysis.columnar`) the first time it is mapped, and again whenever it
+    changes. The conversion is done in chunks, so the whole table is never
+    held in memory. Rows are only read from disk when they are accessed, so
+    tables larger than memory can be used.
 
+    Args:
+        path (str): The path of the data file. It must be entirely numeric.
+        columns (list[str]): The names of the columns to map. If not given,
+          all columns are mapped.
 
-def convert_table_txt(date: str = None):
-    """Converts table.txt to table.tsv."""
+    Returns:
+        dict[str, numpy.ndarray]: An ordered dict of column names and data.
+          It can be indexed by column name like a DataFrame.
+    """
+
+    cache_path = paths.data.cache_path(path)
+
+    if not columnar.is_fresh(cache_path, path):
+
+        with columnar.ColumnWriter(cache_path, __read_names(path)) as writer:
+
+            for chunk in read_chunks(path):
+
+                if not all(pd.api.types.is_numeric_dtype(i) for i in chunk.dtypes):
+                    raise ValueError(f"'{path}' contains non-numeric data and cannot be mapped.")
+
+                writer.append({name: chunk[name].to_numpy() for name in chunk.columns})
+
+            writer.close(source=path)
+
+    return columnar.map_columns(cache_path, columns)
+
+
+@lru_cache(maxsize=8)
+def __open_store(
+    path: str,
+    stamp: tuple[int, int]                                                  #pylint: disable=W0613
+) -> tuple[dict, dict[str, np.ndarray]]:
+    """Returns the index and the mapped columns of a split store. Cached
+    until the store changes, as given by its size and modification time in
+    `stamp`.
+    """
+    return columnar.read_header(path)["meta"]["index"], columnar.map_columns(path)
+
+
+def __map_split(path: str, key: str, columns: list[str] = None) -> dict[str, np.ndarray]:
+    """Maps a split from the split store at `path` into memory, as zero-copy,
+    read-only views of each column.
+    """
+
+    index, mapped = __open_store(path, tuple(columnar.source_stamp(path).values()))
+
+    if key not in index:
+        raise FileNotFoundError(f"'{key}' is not in the split store '{path}'.")
+
+    start, stop = index[key]
+    columns = columns if columns is not None else mapped.keys()
+
+    return {name: mapped[name][start:stop] for name in columns}
+
+
+def read_split(
+    date: str = None,
+    vals: dict[str, str] = None,
+    columns: list[str] = None
+) -> pd.DataFrame | dict[str, np.ndarray]:
+    """Reads the data split by the requested variables and values. See
+    `paths.data.data_path` for `vals`.
+
+    If the data was split into a split store (see `analysis.split`), the split
+    is returned as zero-copy, read-only views of each of its columns, which
+    can be indexed by column name like a DataFrame. Otherwise, its data file
+    is read with `read_data`.
+    """
+
+    path = paths.data.data_path(date, vals)
+
+    if os.path.exists(path):
+        return read_data(path, columns)
+    else:
+        return __map_split(*paths.data.split_store(path), columns)
+
+
+def __stored_paths(path: str) -> list[str]:
+    """Returns the paths of the data files in a dataset, or a directory within
+    it, whose splits were written to a split store. The data files themselves
+    do not exist, but can be read with `read_data`.
+    """
+
+    stored = paths.data.split_store(path)
+
+    if stored is None or not os.path.isfile(stored[0]):
+        return []
+
+    store, prefix = stored
+    index, _ = __open_store(store, tuple(columnar.source_stamp(store).values()))
+
+    return [
+        os.path.join(os.path.splitext(store)[0], *key.split("/")) + ".tsv"
+        for key in sorted(index, key=lambda key: key.split("/"))
+        if prefix == "" or key.startswith(prefix + "/")
+    ]
+
+
+def __executor(workers: int, pool: str) -> Executor:
+    """Returns a pool of the requested type, "thread" or "process"."""
+
+    if pool == "thread":
+        return ThreadPoolExecutor(workers)
+    elif pool == "process":
+        return ProcessPoolExecutor(workers)
+    else:
+        raise ValueError(f"'{pool}' is not a valid pool type. Use 'thread' or 'process'.")
+
+
+def read_dataset(
+    path: str,
+    columns: list[str] = None,
+    float32: bool = False,
+    workers: int = 1,
+    pool: str = "thread",
+    lazy: bool = False
+) -> list[AttributedData]:
+    """Reads a dataset into a list of `AttributedData`. See `read_data` for
+    `columns` and `float32`.
+
+    Data files are returned in order of their paths, regardless of the order
+    in which they are read. If the dataset was split into a split store (see
+    `analysis.split`), its splits are read from the store.
+
+    Args:
+        lazy (bool): Whether to defer reading each data file until its data
+          is accessed. See `AttributedData` and `stream_dataset`.
+        workers (int): The number of data files to read concurrently.
+        pool (str): The type of worker pool used if `workers` is more than 1.
+          "thread" suits datasets of many small files, where reading is
+          limited by file access; "process" suits larger files, where reading
+          is limited by parsing.
+    """
+
+    file_paths = [] if os.path.isdir(path) else __stored_paths(path)
+
+    for root, dirs, files in os.walk(path):
+
+        dirs.sort()                         # Walks subdirectories in order.
+
+        for file in sorted(files):
+            #TODO: raise FileNotFound error
+            if os.path.splitext(file)[1].endswith("tsv"):
+                file_paths.append(os.path.join(root, file))
+
+    if lazy:
+        return [
+            AttributedData(
+                data=None,
+                title=os.path.splitext(os.path.basename(file_path))[0],
+                path=file_path,
+                columns=columns,
+                float32=float32
+            )
+            for file_path in file_paths
+        ]
+
+    if workers > 1:
+        with __executor(workers, pool) as executor:
+            dataset_data = list(executor.map(
+                read_data, file_paths, repeat(columns), repeat(float32)))
+
+    else:
+        dataset_data = [read_data(i, columns, float32) for i in file_paths]
+
+    return [
+        AttributedData(data=data, title=os.path.splitext(os.path.basename(file_path))[0])
+        for data, file_path in zip(dataset_data, file_paths)
+    ]
+
+
+def stream_dataset(
+    attr_data: list[AttributedData],
+    workers: int = 1,
+    pool: str = "thread"
+) -> Iterator[AttributedData]:
+    """Iterates over a dataset, holding only a few data files in memory.
+
+    Each item is yielded with its data loaded, and is released (see
+    `AttributedData.release`) when the next item is requested. Items that are
+    not lazy are yielded as they are.
+
+    Args:
+        attr_data (list[AttributedData]): A dataset, usually from
+          `read_dataset` with `lazy=True`.
+        workers (int): If more than 1, lazy items are read ahead on a pool of
+          this many workers, so at most `workers` + 1 items are in memory.
+        pool (str): The type of worker pool. See `read_dataset`.
+    """
+
+    if workers <= 1:
+        for datum in attr_data:
+            yield datum
+            datum.release()
+        return
+
+    with __executor(workers, pool) as executor:
+
+        pending = deque()
+
+        def next_ready() -> AttributedData:
+            ready, future = pending.popleft()
+            if future is not None:
+                ready.data = future.result()
+            return ready
+
+        for datum in attr_data:
+
+            future = None
+            if datum.path is not None and not datum.loaded:
+                future = executor.submit(read_data, datum.path, datum.columns, datum.float32)
+
+            pending.append((datum, future))
+
+            if len(pending) > workers:
+                ready = next_ready()
+                yield ready
+                ready.release()
+
+        while pending:
+            ready = next_ready()
+            yield ready
+            ready.release()
+
+
+def __append_lines(
+    writer: columnar.ColumnWriter,
+    lines: list[str],
+    names: list[str]
+) -> columnar.ColumnWriter | None:
+    """Parses lines of a data file and appends them to a column writer.
+
+    Returns:
+        columnar.ColumnWriter: The writer, or None if the lines could not be
+          stored in columnar form, in which case the writer is discarded.
+    """
+
+    chunk = pd.read_csv(StringIO("".join(lines)), sep='\t', names=names)
 
     try:
 
-        table_txt_path = os.path.join(paths.data.raw(date), "table.txt")
+        if not all(pd.api.types.is_numeric_dtype(i) for i in chunk.dtypes):
+            raise TypeError("Only numeric data can be stored in columnar form.")
+
+        writer.append({name: chunk[name].to_numpy() for name in names})
+
+        return writer
+
+    except TypeError:
 
-        data = read_data(table_txt_path)
-        data.to_csv(paths.data.data_path(date, None), sep='\t', index=False)
+        writer.discard()
+        return None
 
-        # Removes original table.txt
-        os.remove(table_txt_path)
 
-    except FileNotFoundError:
+def convert_table_txt(date: str = None, max_memory: int = None, cache: bool = True):
+    """Converts table.txt to table.tsv.
 
-        if os.path.isfile(paths.data.data_path(date)):
+    The table is converted line by line, so memory use does not grow with the
+    size of the table. table.tsv is written to a temporary file which is
+    renamed once complete, and table.txt is only removed after that, so an
+    interrupted conversion never loses data.
+
+    Args:
+        max_memory (int): The approximate peak memory, in bytes, to be used
+          for the conversion. Limits the number of lines parsed at a time for
+          the columnar cache. See `read_chunks`.
+        cache (bool): Whether to also write the columnar cache of table.tsv
+          (see `read_data`) in the same pass, so that table.tsv need not be
+          parsed again.
+    """
+
+    table_txt_path = paths.tables.txt_path(date)
+    table_tsv_path = paths.data.data_path(date)
+
+    if not os.path.isfile(table_txt_path):
+
+        if os.path.isfile(table_tsv_path):
             print("Already converted to tsv.")
         else:
             print("Raw data not found.")
+
+        return
+
+    temp_path = f"{table_tsv_path}.{os.getpid()}.tmp"
+    writer = None
+
+    try:
+
+        with open(table_txt_path, 'r', encoding="utf-8") as src, \
+            open(temp_path, 'w', encoding="utf-8") as dest:
+
+            names = __parse_names(src.readline())
+            dest.write('\t'.join(names) + '\n')
+
+            if cache:
+                writer = columnar.ColumnWriter(paths.data.cache_path(table_tsv_path), names)
+
+            batch_rows = __chunk_rows(len(names), max_memory)
+            batch = []
+
+            for line in src:
+
+                dest.write(line)
+
+                if writer is not None:
+                    batch.append(line)
+                    if len(batch) >= batch_rows:
+                        writer = __append_lines(writer, batch, names)
+                        batch = []
+
+            if writer is not None and batch:
+                writer = __append_lines(writer, batch, names)
+
+        os.replace(temp_path, table_tsv_path)
+
+        if writer is not None:
+            writer.close(source=table_tsv_path)
+            writer = None
+
+    finally:
+
+        if writer is not None:
+            writer.discard()
+
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    # Removes original table.txt
+    os.remove(table_txt_path)
@@ -1,72 +1,545 @@
-"""Splits data by variables."""
+"""Splits data by variables.
 
+Splits are written either to a data file each, or to a split store: a single
+columnar file (see `analysis.columnar`) per split level, holding the rows of
+every split contiguously. The header of a split store indexes the range of
+rows of each split, keyed as in `paths.data.split_store`, so that a split can
+be mapped from the store as a zero-copy slice (see `read.read_split`). Data
+files can be exported from a split store with `export_split`.
+
+When splits are written to data files, a manifest (see
+`paths.data.manifest_path`) records the byte offset of the end of the last
+row that was split, that row, the dtypes of the columns, the data files that
+were written, and the state of each split (its run numbers and initial values
+of t). An incremental split checks that the table still begins with the rows
+that were split, and then only splits the rows which follow, appending them to
+the data files.
+"""
+
+import json
+import os
+import re
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AbstractContextManager, contextmanager
+from shutil import rmtree
+
+import numpy as np
 import pandas as pd
 
-from analysis import paths, read, write
+from analysis import columnar, paths, read, write
 
 
 def __split_variable(
-    data: pd.DataFrame,
+    data: pd.DataFrame | dict[str, np.ndarray],
     var: str,
-    reset_t: bool = True
-) -> dict[float, pd.DataFrame]:
-    """"Splits data by a variable."""
+    reset_t: bool = True,
+    state: dict = None
+) -> dict[tuple[float, int], pd.DataFrame]:
+    """"Splits data into runs of consecutive rows with the same value of a
+    variable.
+
+    A value that recurs in separate segments of a sweep is split into separate
+    runs. Each split is keyed by its value and its run number for that value,
+    starting at 1. The table is scanned once, and each run is sliced as a
+    contiguous range of rows.
+
+    `data` may also be a column mapping from `read.map_data`, in which case
+    only the rows of each split are read into memory.
+
+    Args:
+        state (dict): The run counts and initial values of t, updated as runs
+          are found. Pass the same dict for consecutive chunks of a table so
+          that runs spanning chunks are joined, and t is reset consistently.
+    """
 
-    #FIXME: This code will group all rows with the same value of var together;
-    #       expected behavior is that different groups should be separated.
+    state = state if state is not None else {}
+    runs = state.setdefault("runs", {})
+    initial_t = state.setdefault("initial_t", {})
+
+    arrays = {name: np.asarray(col) for name, col in data.items()}
+    var_values = arrays[var]
+
+    if len(var_values) == 0:
+        return {}
+
+    bounds = np.concatenate((
+        [0],
+        np.flatnonzero(var_values[1:] != var_values[:-1]) + 1,
+        [len(var_values)]
+    ))
 
-    unique_values = data[var].unique()
     extracted_data = {}
 
-    for phi in unique_values:
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+
+        value = var_values[start].item()
+        if start > 0 or state.get("last") != value:
+            runs[value] = runs.get(value, 0) + 1
+        state["last"] = value
 
-        extract = data[data[var] == phi].reset_index(drop=True)
+        key = (value, runs[value])
+        extract = pd.DataFrame({name: arr[start:stop] for name, arr in arrays.items()})
 
         if reset_t:
-            initial_t = extract.at[0, "t"]
-            extract["t"] -= initial_t
+            initial_t.setdefault(key, extract.at[0, "t"])
+            extract["t"] -= initial_t[key]
 
-        extracted_data[phi] = extract
+        extracted_data[key] = extract
 
     return extracted_data
 
 
-def split_phi(date: str = None, reset_t: bool = True):
-    """"Splits data by phi."""
+def __run_name(name: str, run: int) -> str:
+    """Returns the name of a split, suffixed with its run number if its value
+    recurs in the table.
+    """
+    return name if run == 1 else f"{name}_run{run}"
+
+
+def __read_table(
+    date: str,
+    mapped: bool,
+    max_memory: int
+) -> Iterable[pd.DataFrame | dict[str, np.ndarray]]:
+    """Reads the table as a sequence of chunks.
+
+    The table is memory-mapped as a single chunk if `mapped`, read in chunks
+    bounded by `max_memory` if given, or otherwise read as a single chunk.
+    Chunks are read with the dtypes of the whole table, so that a value is
+    named the same in every chunk.
+    """
+
+    table = paths.data.data_path(date)
+
+    if mapped:
+        return [read.map_data(table)]
+    elif max_memory is not None:
+        return read.read_chunks(table, max_memory=max_memory,
+            dtypes=read.read_dtypes(table, max_memory=max_memory))
+    else:
+        return [read.read_data(table)]
+
+
+def __write_tsv(data: pd.DataFrame, path: str, append: bool):
+    """Writes a split to its data file, or appends it without a header."""
+    data.to_csv(path, sep='\t', index=False, mode='a' if append else 'w', header=not append)
+
+
+@contextmanager
+def __tsv_output(
+    date: str,
+    workers: int,
+    written: set[str]
+) -> Iterator[Callable[[pd.DataFrame, dict[str, str]], None]]:
+    """Yields a function which writes a split to its data file, appending to
+    it if it is in `written`. `written` is updated with each data file.
+
+    If `workers` is more than 1, data files are formatted and written on a
+    pool of that many processes. At most 2 writes per worker are queued, to
+    bound the memory held by pending splits. Directories are only created by
+    this process, before their first write is queued, and each write waits for
+    earlier writes to the same data file, so the output is identical to a
+    serial write.
+    """
+
+    def prepare(path: str) -> bool:
+        append = path in written
+        if not append:
+            write.prep_dir(os.path.dirname(path), clear=False)
+            written.add(path)
+        return append
+
+    if workers <= 1:
+
+        def write_serial(data: pd.DataFrame, vals: dict[str, str]):
+            path = paths.data.data_path(date, vals)
+            __write_tsv(data, path, prepare(path))
+
+        yield write_serial
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+
+        pending = deque()
+        latest = {}
+
+        def write_parallel(data: pd.DataFrame, vals: dict[str, str]):
+
+            path = paths.data.data_path(date, vals)
+            append = prepare(path)
+
+            if path in latest:
+                latest[path].result()
+
+            while len(pending) >= 2 * workers:
+                pending.popleft().result()
+
+            latest[path] = executor.submit(__write_tsv, data, path, append)
+            pending.append(latest[path])
+
+        yield write_parallel
+
+        for future in pending:
+            future.result()
+
+
+def __normalize_key(key: str) -> str:
+    """Returns a key of a split store with each number written as a float, so
+    that keys naming the same values with different dtypes are equal.
+    """
+    return re.sub(r"\d+(\.\d*)?(e[-+]?\d+)?", lambda match: repr(float(match[0])), key)
+
+
+def __store_split(
+    data: pd.DataFrame,
+    key: str,
+    writer: columnar.ColumnWriter,
+    index: dict,
+    normalized: dict[str, str]
+):
+    """Appends a split to a split store, extending its range of rows in
+    `index` if it was already stored in this run.
+
+    Raises ValueError if the key names the same values as another key, as
+    given by `normalized`, which maps the normalized keys to the keys in
+    `index`.
+    """
+
+    if key not in index:
+
+        other = normalized.setdefault(__normalize_key(key), key)
+        if other != key:
+            raise ValueError(f"The splits '{other}' and '{key}' are the same values with"
+                + " different dtypes.")
+
+    start = writer.rows
+    writer.append({name: data[name].to_numpy() for name in data.columns})
+
+    index[key] = [index[key][0] if key in index else start, writer.rows]
+
+
+@contextmanager
+def __store_output(
+    date: str,
+    names: list[str]
+) -> Iterator[Callable[[pd.DataFrame, dict[str, str]], None]]:
+    """Yields a function which appends a split to the split store of the data
+    split by `names`. The split store is only written if no exception is
+    raised.
+    """
+
+    store_path = paths.data.store_path(names, date)
+    write.prep_dir(os.path.dirname(store_path), clear=False)
+
+    writer = None
+    index = {}
+    normalized = {}
+
+    def store_split(data: pd.DataFrame, vals: dict[str, str]):
+        nonlocal writer
+        if writer is None:
+            writer = columnar.ColumnWriter(store_path, data.columns)
+        __store_split(data, paths.data.split_store(paths.data.data_path(date, vals))[1], writer,
+            index, normalized)
+
+    try:
+        yield store_split
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+
+    if writer is not None:
+        writer.close(source=paths.data.data_path(date), meta={"index": index})
+
+
+def __split_output(
+    date: str,
+    names: list[str],
+    store: bool,
+    workers: int,
+    written: set[str]
+) -> AbstractContextManager[Callable[[pd.DataFrame, dict[str, str]], None]]:
+    """Prepares the output of the data split by `names`, and returns a context
+    manager yielding a function which writes a split given its data and its
+    values (see `paths.data.data_path`).
+
+    Splits are written to data files (see `__tsv_output` for `workers` and
+    `written`), or to a split store if `store`. The output of the other format is removed, so
+    that it cannot be read in place of the new splits.
+    """
+
+    dataset = paths.data.dataset_dir(date, vals=dict.fromkeys(names))
+    store_path = paths.data.store_path(names, date)
+
+    if store:
+        if os.path.exists(dataset):
+            rmtree(dataset)
+        return __store_output(date, names)
+
+    write.prep_dir(dataset)
+    if os.path.exists(store_path):
+        os.remove(store_path)
+
+    return __tsv_output(date, workers, written)
+
+
+def __dump_state(state: dict) -> dict:
+    """Converts the state of a split (see `__split_variable`) to JSON."""
+
+    return {
+        "runs": [[value, run] for value, run in state.get("runs", {}).items()],
+        "initial_t": [[*key, float(t)] for key, t in state.get("initial_t", {}).items()],
+        "last": state.get("last")
+    }
+
+
+def __load_state(state: dict) -> dict:
+    """Converts the state of a split from JSON. See `__dump_state`."""
+
+    return {
+        "runs": {value: run for value, run in state["runs"]},
+        "initial_t": {(value, run): t for value, run, t in state["initial_t"]},
+        "last": state["last"]
+    }
+
+
+def __table_tail(path: str, offset: int) -> str:
+    """Returns the last row of a data file before a byte offset."""
+
+    with open(path, 'rb') as file:
+        file.seek(max(0, offset - 4096))
+        data = file.read(offset - file.tell())
+
+    return data[data.rstrip(b"\n").rfind(b"\n") + 1:].decode("utf-8")
+
+
+def __read_manifest(path: str, table: str, reset_t: bool) -> dict | None:
+    """Reads the manifest of an earlier split, if it exists and the table
+    still begins with the rows that were split.
+    """
+
+    try:
+        with open(path, 'r', encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if manifest["reset_t"] != reset_t or "dtypes" not in manifest \
+        or manifest["offset"] > os.path.getsize(table) \
+        or __table_tail(table, manifest["offset"]) != manifest["tail"]:
+        return None
+
+    return manifest
+
+
+def __appended_dtypes(
+    table: str,
+    offset: int,
+    max_memory: int,
+    dtypes: dict[str, np.dtype]
+) -> tuple[dict[str, np.dtype], int]:
+    """Widens `dtypes` over the complete rows of the table which follow a byte
+    offset. See `read.widen_dtypes`.
+
+    Returns:
+        tuple: The widened dtypes, and the byte offset of the end of the last
+          complete row.
+    """
+
+    for chunk, offset in read.read_appended(table, offset, max_memory=max_memory):
+        dtypes = read.widen_dtypes(dtypes, chunk)
+
+    return dtypes, offset
+
+
+def __split_table(
+    date: str,
+    names: list[str],
+    split_chunk: Callable[[pd.DataFrame | dict[str, np.ndarray], dict, Callable], None],
+    reset_t: bool,
+    mapped: bool,
+    max_memory: int,
+    store: bool,
+    workers: int,
+    incremental: bool
+):
+    """Splits the table by `names`, one chunk at a time.
+
+    `split_chunk` splits a chunk, given the chunk, the states of the splits,
+    and a function which writes a split (see `__split_output`). The states
+    are a dict of the state of each variable, keyed by its name. States of
+    variables after the first are dicts of states, keyed by the value and run
+    number of the split of the previous variable that they belong to.
+
+    Incremental splits parse the rows which follow the last split with the
+    dtypes of the rows that were split, so that a value is named the same in
+    every run. If the rows which follow need wider dtypes, the whole table is
+    split again.
+
+    See `split_phi` for the other arguments.
+    """
+
+    table = paths.data.data_path(date)
+    dataset = paths.data.dataset_dir(date, vals=dict.fromkeys(names))
+    manifest_path = paths.data.manifest_path(names, date)
+
+    incremental = incremental and not store
+    manifest = __read_manifest(manifest_path, table, reset_t) if incremental else None
+    dtypes, end = None, None
+
+    if manifest is not None:
+
+        # Removed until the split is complete, so an interrupted split is not resumed.
+        os.remove(manifest_path)
+
+        offset = manifest["offset"]
+        dtypes = {name: np.dtype(dtype) for name, dtype in manifest["dtypes"].items()}
+        appended_dtypes, end = __appended_dtypes(table, offset, max_memory, dtypes)
+
+        if appended_dtypes != dtypes:
+            manifest = None
+
+    if manifest is not None:
+
+        states = {
+            names[0]: __load_state(manifest["states"][0]),
+            **{
+                name: {(value, run): __load_state(state) for value, run, state in states}
+                for name, states in zip(names[1:], manifest["states"][1:])
+            }
+        }
+        written = {os.path.join(dataset, *i.split("/")) for i in manifest["written"]}
+        output = __tsv_output(date, workers, written)
+
+    else:
+
+        states = {name: {} for name in names}
+        written = set()
+        output = __split_output(date, names, store, workers, written)
+
+        with open(table, 'rb') as file:
+            offset = len(file.readline())           # The end of the header.
+
+        if incremental:
+            dtypes, end = __appended_dtypes(table, offset, max_memory, {})
+
+    with output as write_split:
+
+        # Incremental splits only split complete rows, which can be resumed from.
+        if incremental:
+            for chunk, offset in read.read_appended(table, offset, max_memory=max_memory,
+                dtypes=dtypes, end=end):
+                split_chunk(chunk, states, write_split)
+        else:
+            for chunk in __read_table(date, mapped, max_memory):
+                split_chunk(chunk, states, write_split)
+
+    if not incremental:
+        return
+
+    manifest = {
+        "reset_t": reset_t,
+        "offset": offset,
+        "tail": __table_tail(table, offset),
+        "dtypes": {name: dtype.str for name, dtype in dtypes.items()},
+        "written": sorted(os.path.relpath(i, dataset).replace(os.sep, "/") for i in written),
+        "states": [
+            __dump_state(states[names[0]]),
+            *[
+                [[*key, __dump_state(state)] for key, state in states[name].items()]
+                for name in names[1:]
+            ]
+        ]
+    }
+
+    with open(manifest_path, 'w', encoding="utf-8") as file:
+        json.dump(manifest, file)
+
+
+def split_phi(
+    date: str = None,
+    reset_t: bool = True,
+    mapped: bool = False,
+    max_memory: int = None,
+    store: bool = False,
+    workers: int = 1,
+    incremental: bool = False
+):
+    """"Splits data by phi.
+
+    Args:
+        mapped (bool): Whether to memory-map the table instead of reading it
+          into memory. See `read.map_data`.
+        max_memory (int): The approximate peak memory, in bytes, to be used. If
+          given, the table is read and split in chunks. See `read.read_chunks`.
+        store (bool): Whether to write the splits to a split store instead of
+          a data file each.
+        workers (int): The number of processes formatting and writing data
+          files. Not used with `store`.
+        incremental (bool): Whether to only split the rows which were added to
+          the table since its last incremental split with the same `reset_t`.
+          Otherwise, the whole table is split, and recorded for the next
+          incremental split. Only complete rows are split, so a table which is
+          still being written can be split. `mapped` is not used. Not used
+          with `store`.
+    """
+
+    def split_chunk(chunk, states, write_split):
+        for (phi, run), data in __split_variable(chunk, "phi", reset_t, states["phi"]).items():
+            write_split(data, {"phi": __run_name(f"{phi:03}deg", run)})
+
+    __split_table(date, ["phi"], split_chunk, reset_t, mapped, max_memory, store, workers,
+        incremental)
+
 
-    split_data = __split_variable(read.read_data(paths.data.data_path(date)), "phi", reset_t)
-    destination = paths.data.dataset_dir(date, vals={"phi": None})
+def split_phi_fRF(
+    date: str = None,
+    reset_t: bool = True,
+    mapped: bool = False,
+    max_memory: int = None,
+    store: bool = False,
+    workers: int = 1,
+    incremental: bool = False
+):
+    """Splits data by phi, then f_RF. See `split_phi` for `mapped`,
+    `max_memory`, `store`, `workers`, and `incremental`.
+    """
 
-    write.prep_dir(destination)
+    def split_chunk(chunk, states, write_split):
+        for (phi, run), data in __split_variable(chunk, "phi", reset_t, states["phi"]).items():
 
-    for phi, data in split_data.items():
-        data.to_csv(
-            paths.data.data_path(date, {"phi": f"{phi:03}deg"}),
-            sep='\t',
-            index=False
-        )
+            phi_name = __run_name(f"{phi:03}deg", run)
+            split_data_phi_fRF = __split_variable(
+                data, "f_RF", reset_t, states["f_RF"].setdefault((phi, run), {}))
 
+            for (fRF, fRF_run), split_data in split_data_phi_fRF.items():
+                write_split(
+                    split_data,
+                    {"phi": phi_name, "f_RF": __run_name(f"{fRF / 10**9}GHz", fRF_run)}
+                )
 
-def split_phi_fRF(date: str = None, reset_t: bool = True):
-    """Splits data by phi, then f_RF."""
+    __split_table(date, ["phi", "f_RF"], split_chunk, reset_t, mapped, max_memory, store,
+        workers, incremental)
 
-    split_data_phi = __split_variable(
-        read.read_data(paths.data.data_path(date)), "phi", reset_t)
 
-    write.prep_dir(paths.data.dataset_dir(date, vals={"phi": None, "f_RF": None}))
+def export_split(names: list[str], date: str = None):
+    """Writes the splits in a split store to a data file each, as if the data
+    had been split without a split store.
 
-    for phi, data in split_data_phi.items():
+    Args:
+        names (list[str]): The variables by which the data was split, in order
+          of how the data was split.
+    """
 
-        split_data_phi_fRF = __split_variable(data, "f_RF", reset_t)
+    dataset = paths.data.dataset_dir(date, vals=dict.fromkeys(names))
 
-        write.prep_dir(paths.data.dataset_dir(date, vals={"phi": f"{phi:03}deg", "f_RF": None}))
+    if os.path.exists(dataset):
+        rmtree(dataset)                 # Existing data files would be read instead of the store.
 
-        for fRF, split_data in split_data_phi_fRF.items():
-            split_data.to_csv(
-                paths.data.data_path(
-                    date,
-                    vals={"phi": f"{phi:03}deg", "f_RF": f"{fRF / 10**9}GHz"}
-                ),
-                sep='\t',
-                index=False
-            )
+    for datum in read.read_dataset(dataset, lazy=True):
+        os.makedirs(os.path.dirname(datum.path), exist_ok=True)
+        datum.data.to_csv(datum.path, sep='\t', index=False)
+        datum.release()
@@ -0,0 +1,22 @@
+"""Fixtures shared by the tests of the analysis package."""
+
+import os
+
+import pytest
+
+from analysis import framecache, paths
+
+DATE = "2000-01-01_0000"
+
+
+@pytest.fixture
+def result(tmp_path, monkeypatch) -> str:
+    """Points the results directory at a temporary directory, and returns the
+    date of an empty result within it.
+    """
+
+    monkeypatch.setattr(paths.top, "results_root", lambda: str(tmp_path))
+    os.makedirs(paths.data.raw(DATE))
+    framecache.FRAMES.clear()
+
+    return DATE
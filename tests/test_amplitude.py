@@ -0,0 +1,54 @@
+"""Tests of `analysis.amplitude`."""
+
+import numpy as np
+import pytest
+
+from analysis import amplitude, paths, read
+
+SEGMENT_ROWS = 20
+
+
+def write_table(date: str, segments: list[tuple[float, float, float]]):
+    """Writes segments of rows, given their phi, f_RF and amplitude, to the
+    table of a result. Each magnetization component alternates between plus
+    and minus the amplitude.
+    """
+
+    lines = ["t\tmx\tmy\tmz\tphi\tf_RF\n"]
+
+    for i, (phi, fRF, amp) in enumerate(segments):
+        for j in range(SEGMENT_ROWS):
+            value = amp * (-1)**j
+            lines.append(
+                f"{(i * SEGMENT_ROWS + j) * 1e-12:e}\t{value}\t{value}\t{value}\t{phi}\t{fRF}\n")
+
+    with open(paths.data.data_path(date), 'w', encoding="utf-8") as file:
+        file.writelines(lines)
+
+
+def test_recurring_phi_has_a_column_per_run(result):
+
+    write_table(result, [(0, 6e9, 1), (0, 7e9, 2), (45, 6e9, 3), (45, 7e9, 4), (0, 6e9, 5),
+        (0, 7e9, 6)])
+
+    amplitude.amp_phi_fRF(result, skip_duration=0)
+    amplitude.max_amp_phi(result)
+
+    amps = read.read_data(paths.calcvals.amp_path("mx", result))
+    assert list(amps.columns) == ["f_RF", "0deg", "45deg", "0deg_run2"]
+    np.testing.assert_allclose(amps.iloc[:, 1:].to_numpy(), [[1, 3, 5], [2, 4, 6]])
+
+    max_amps = read.read_data(paths.calcvals.maxamp_path(result))
+    np.testing.assert_allclose(max_amps["phi"], [0, 45, 0])
+    np.testing.assert_allclose(max_amps["MaxAmp_mz"], [2, 4, 6])
+
+
+def test_recurring_fRF_within_a_run_of_phi_warns(result):
+
+    write_table(result, [(0, 6e9, 1), (0, 7e9, 2), (0, 6e9, 3), (45, 6e9, 4)])
+
+    with pytest.warns(UserWarning, match="1 segments repeat a value of f_RF"):
+        amplitude.amp_phi_fRF(result, skip_duration=0)
+
+    amps = read.read_data(paths.calcvals.amp_path("my", result))
+    np.testing.assert_allclose(amps.iloc[:, 1:].to_numpy(), [[1, 4], [2, np.nan]])
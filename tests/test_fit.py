@@ -0,0 +1,81 @@
+"""Tests of `analysis.fit`."""
+
+import numpy as np
+import pandas as pd
+
+from analysis import fit, paths, write
+
+
+def dual_mode_columns(n_columns: int = 360) -> tuple[np.ndarray, dict[str, np.ndarray]]:
+    """Returns noisy amplitudes of two resolved modes, near 4.5 and 5.3 GHz,
+    whose heights vary with phi.
+    """
+
+    rng = np.random.default_rng(1)
+    x = np.linspace(3e9, 7e9, 81)
+    columns = {}
+
+    for phi in range(n_columns):
+
+        heights = 0.01 * (0.3 + np.abs([np.cos(np.radians(phi)), np.sin(np.radians(phi))]))
+
+        columns[str(phi)] = (
+            fit.cauchy(x, 4.5e9 + rng.uniform(-1e8, 1e8), 0.15e9, heights[0])
+            + fit.cauchy(x, 5.3e9 + rng.uniform(-1e8, 1e8), 0.2e9, heights[1])
+            + rng.normal(0, 1e-4, len(x))
+        )
+
+    return x, columns
+
+
+def test_fit_peak_columns_resolves_dual_modes():
+
+    x, columns = dual_mode_columns()
+
+    # The single peak of some columns is a broad peak between the modes.
+    single = fit.fit_peak_columns(x, columns, max_peaks=1)
+    assert single["x_0_1"].between(4.7e9, 5.1e9).any()
+
+    fitted = fit.fit_peak_columns(x, columns, max_peaks=2)
+
+    assert (fitted["peaks"] == 2).all()
+    np.testing.assert_allclose(fitted["x_0_1"], 4.5e9, atol=1.2e8)
+    np.testing.assert_allclose(fitted["x_0_2"], 5.3e9, atol=1.2e8)
+    np.testing.assert_allclose(fitted["gamma_1"], 0.15e9, rtol=0.1)
+    np.testing.assert_allclose(fitted["gamma_2"], 0.2e9, rtol=0.1)
+
+
+def test_fit_peak_columns_selects_one_peak_for_a_clean_peak():
+
+    x = np.linspace(3e9, 7e9, 81)
+    columns = {str(phi): fit.cauchy(x, 4.6e9 + 1e7 * phi, 0.2e9, 0.01) for phi in range(10)}
+
+    fitted = fit.fit_peak_columns(x, columns, max_peaks=2)
+
+    assert (fitted["peaks"] == 1).all()
+    np.testing.assert_allclose(fitted["x_0_1"], 4.6e9 + 1e7 * np.arange(10), rtol=1e-6)
+
+
+def test_fit_cauchy_batch_is_independent_of_workers(result):
+
+    rng = np.random.default_rng(2)
+    x = np.linspace(3e9, 7e9, 81)
+    amps = {"f_RF": x}
+
+    for phi in range(3 * fit.CHUNK_COLUMNS + 5):
+        amps[f"{phi}deg"] = fit.cauchy(x, 5e9 + 2e8 * np.sin(np.radians(phi)), 0.2e9, 0.01) \
+            + rng.normal(0, 1e-4, len(x))
+
+    write.prep_dir(paths.calcvals.root(result), clear=False)
+    pd.DataFrame(amps).to_csv(paths.calcvals.amp_path("mx", result), sep='\t', index=False)
+
+    fitted = {}
+
+    for workers in (1, 4):
+
+        assert not fit.fit_cauchy_batch([result], ["mx"], (3.5e9, 6.5e9), workers=workers)
+
+        with open(paths.calcvals.fitted_amp_path("mx", result), 'rb') as file:
+            fitted[workers] = file.read()
+
+    assert fitted[1] == fitted[4]
@@ -0,0 +1,26 @@
+"""Tests of `analysis.framecache`."""
+
+import pandas as pd
+
+from analysis import framecache
+
+
+def test_subsets_are_served_from_cached_superset(tmp_path):
+
+    path = tmp_path / "data.tsv"
+    path.write_text("a\tb\tc\n1\t2\t3\n", encoding="utf-8")
+    data = pd.DataFrame({"a": [1], "b": [2], "c": [3]})
+    cache = framecache.FrameCache()
+
+    cache.put(str(path), data[["b", "a"]], ["b", "a"])
+    pd.testing.assert_frame_equal(cache.get(str(path), ["a", "b"]), data[["a", "b"]])
+    assert cache.get(str(path)) is None
+
+    # A superset replaces the entries it holds.
+    cache.put(str(path), data)
+    assert cache.size == data.memory_usage(index=True, deep=True).sum()
+
+    pd.testing.assert_frame_equal(cache.get(str(path), ["c", "a"]), data[["c", "a"]])
+    pd.testing.assert_frame_equal(cache.get(str(path)), data)
+    assert cache.get(str(path), ["d"]) is None
+    assert cache.get(str(path), ["a"], (True,)) is None
@@ -0,0 +1,40 @@
+"""Tests of `analysis.freshness`."""
+
+import json
+import os
+
+from analysis import freshness
+
+
+def touch(path: str, content: str, mtime_ns: int):
+    """Writes a file and sets its modification time."""
+
+    with open(path, 'w', encoding="utf-8") as file:
+        file.write(content)
+
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_inputs_are_hashed_after_their_first_rewrite(tmp_path):
+
+    data, output = str(tmp_path / "data.tsv"), str(tmp_path / "plot.pdf")
+    touch(data, "1\t2\n", 10**18)
+    touch(output, "", 10**18)
+
+    freshness.record(output, [data])
+
+    with open(tmp_path / freshness.MANIFEST_NAME, 'r', encoding="utf-8") as file:
+        assert "hash" not in json.load(file)["plot.pdf"]["inputs"]["data.tsv"]
+
+    assert freshness.is_fresh(output, [data])
+
+    # Rewritten with the same content: not yet comparable, so out of date once.
+    touch(data, "1\t2\n", 2 * 10**18)
+    assert not freshness.is_fresh(output, [data])
+    freshness.record(output, [data])
+
+    touch(data, "1\t2\n", 3 * 10**18)
+    assert freshness.is_fresh(output, [data])
+
+    touch(data, "3\t4\n", 4 * 10**18)
+    assert not freshness.is_fresh(output, [data])
@@ -0,0 +1,27 @@
+"""Tests of `analysis.read`."""
+
+import os
+
+import pandas as pd
+
+from analysis import framecache, paths, read
+
+
+def test_columnar_cache_is_built_only_for_large_files(result, monkeypatch):
+
+    path = paths.data.data_path(result)
+    pd.DataFrame({"t": [0.0, 1e-12, 2e-12], "mx": [0.1, 0.2, 0.3]}) \
+        .to_csv(path, sep='\t', index=False)
+
+    expected = read.read_data(path)
+    assert not os.path.exists(paths.data.cache_path(path))
+
+    monkeypatch.setattr(read, "CACHE_MIN_SIZE", os.path.getsize(path))
+    framecache.FRAMES.clear()
+
+    pd.testing.assert_frame_equal(read.read_data(path), expected)
+    assert os.path.exists(paths.data.cache_path(path))
+
+    framecache.FRAMES.clear()
+
+    pd.testing.assert_frame_equal(read.read_data(path), expected)
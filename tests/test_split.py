@@ -0,0 +1,120 @@
+"""Tests of `analysis.split`."""
+
+import os
+
+import numpy as np
+import pytest
+
+from analysis import columnar, paths, read, split
+
+# Rows per segment, and the memory which reads a 5-column table in chunks of 10 rows.
+SEGMENT_ROWS = 15
+CHUNK_MEMORY = 10 * 5 * 8 * 4
+
+# phi is integer-valued in the first rows, so a chunk of only those rows
+# parses it as integers, while the whole table parses it as floats.
+SEGMENTS = [("0", "6e9"), ("0", "7e9"), ("45", "6e9"), ("45", "7e9"), ("22.5", "6e9"),
+    ("0", "6e9")]
+
+
+def write_table(date: str, segments: list[tuple[str, str]], append: bool = False):
+    """Writes segments of rows, given their phi and f_RF as written in the
+    table, to the table of a result.
+    """
+
+    lines = [] if append else ["t\tmx\tmy\tphi\tf_RF\n"]
+
+    for i, (phi, fRF) in enumerate(segments):
+        for j in range(SEGMENT_ROWS):
+            lines.append(f"{(i * SEGMENT_ROWS + j) * 1e-12:e}\t{0.1 * j:e}\t{j}\t{phi}\t{fRF}\n")
+
+    with open(paths.data.data_path(date), 'a' if append else 'w', encoding="utf-8") as file:
+        file.writelines(lines)
+
+
+def read_split_files(date: str, names: list[str]) -> dict[str, str]:
+    """Returns the contents of each data file of a split, keyed by its path
+    relative to the dataset.
+    """
+
+    dataset = paths.data.dataset_dir(date, dict.fromkeys(names))
+    files = {}
+
+    for root, _, filenames in os.walk(dataset):
+        for filename in filenames:
+            if filename.endswith(".tsv"):
+                with open(os.path.join(root, filename), 'r', encoding="utf-8") as file:
+                    files[os.path.relpath(os.path.join(root, filename), dataset)] = file.read()
+
+    return files
+
+
+@pytest.mark.parametrize("split_data, names", [
+    (split.split_phi, ["phi"]),
+    (split.split_phi_fRF, ["phi", "f_RF"])
+])
+def test_chunked_split_matches_whole_table(result, split_data, names):
+
+    write_table(result, SEGMENTS)
+
+    split_data(result)
+    expected = read_split_files(result, names)
+
+    split_data(result, max_memory=CHUNK_MEMORY)
+
+    assert read_split_files(result, names) == expected
+    assert not any(i.startswith("000deg") for i in expected)
+
+
+@pytest.mark.parametrize("split_data, names", [
+    (split.split_phi, ["phi"]),
+    (split.split_phi_fRF, ["phi", "f_RF"])
+])
+@pytest.mark.parametrize("initial, appended", [
+    (SEGMENTS[:3], SEGMENTS[3:]),
+    (SEGMENTS[:5], [("0", "6e9"), ("90", "7e9")]),
+    (SEGMENTS[:3], [("0", "6e9"), ("90", "7e9")])
+])
+def test_incremental_split_matches_full_split(result, split_data, names, initial, appended):
+
+    # phi is integer-valued in the first rows or in the appended rows, so they
+    # parse with different dtypes when read on their own.
+    write_table(result, initial)
+    split_data(result, incremental=True, max_memory=CHUNK_MEMORY)
+
+    write_table(result, appended, append=True)
+    split_data(result, incremental=True, max_memory=CHUNK_MEMORY)
+    incremental = read_split_files(result, names)
+
+    split_data(result)
+
+    assert incremental == read_split_files(result, names)
+
+
+def test_chunked_split_store_matches_whole_table(result):
+
+    write_table(result, SEGMENTS)
+    store_path = paths.data.store_path(["phi", "f_RF"], result)
+
+    split.split_phi_fRF(result, store=True)
+    index = columnar.read_header(store_path)["meta"]["index"]
+    columns = columnar.read_columns(store_path)
+
+    split.split_phi_fRF(result, store=True, max_memory=CHUNK_MEMORY)
+
+    assert columnar.read_header(store_path)["meta"]["index"] == index
+    for name, data in columnar.read_columns(store_path).items():
+        np.testing.assert_array_equal(data, columns[name])
+
+
+def test_split_store_refuses_keys_of_the_same_values(result, monkeypatch):
+
+    # Without the dtypes of the whole table, phi=0 is named "000deg" in some
+    # chunks and "0.0deg" in others.
+    write_table(result, SEGMENTS)
+    monkeypatch.setattr(read, "read_dtypes", lambda *args, **kwargs: {})
+
+    with pytest.raises(ValueError, match="000deg"):
+        split.split_phi(result, store=True, max_memory=CHUNK_MEMORY)
+
+    assert not os.path.exists(paths.data.store_path(["phi"], result))